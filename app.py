@@ -4,23 +4,41 @@ from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 import snowflake.connector
 import pandas as pd
-from snowflake.core import Root
 from dotenv import load_dotenv
 import cortex_chat
+from generate_jwt import load_private_key
+from connection_pool import SnowflakeConnectionPool
+from config import SFConfig
 import time
 import requests
 import tempfile
 import io
+import re
+import json
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+import socket
+import ssl
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from dataclasses import dataclass
+from threading import Lock, RLock, Thread
+from cachetools import TTLCache
+from weakref import WeakKeyDictionary
 
 # Experimental charting removed - application uses charter.py (Plotly) instead
 # Import AI-powered charting
 from charter import ai_plot
+from dataframe_utils import coerce_for_plot
 # Import data filter modal functionality
 from data_filter_modal import (
     get_filter_data_button_element, 
     create_filter_modal, 
     apply_pandas_filters, 
     extract_filter_values_from_modal,
+    parse_filter_modal_metadata,
     create_filtered_result_message,
     FILTER_DATA_BUTTON_ACTION_ID,
     FILTER_MODAL_CALLBACK_ID
@@ -29,6 +47,8 @@ from data_filter_modal import (
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # CURRENT USER CONFIGURATION FOR ENTITLEMENT-BASED FILTERING
 # Set this to the email of the current user to demonstrate entitlement filtering
 # All query results will be filtered based on this user's access level and hierarchy
@@ -41,35 +61,28 @@ CURRENT_USER_EMAIL = "sarah.johnson@company.com"    # 1. CRO (TOP) - Reports to:
 # CURRENT_USER_EMAIL = "addison.wells@company.com"    # 5. Sales Rep (BOTTOM) - Reports to: Patricia Kim - Can see only own data
 
 # --- Environment Variables ---
-ACCOUNT = os.getenv("ACCOUNT")
-HOST = os.getenv("HOST")
-USER = os.getenv("DEMO_USER")
-DATABASE = os.getenv("DEMO_DATABASE")
-SCHEMA = os.getenv("DEMO_SCHEMA")
-ROLE = os.getenv("DEMO_USER_ROLE")
-WAREHOUSE = os.getenv("WAREHOUSE")
-SLACK_APP_TOKEN = os.getenv("SLACK_APP_TOKEN")
-SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
-AGENT_ENDPOINT = os.getenv("AGENT_ENDPOINT")
-SEMANTIC_MODEL = os.getenv("SEMANTIC_MODEL")
-SEARCH_SERVICE = os.getenv("SEARCH_SERVICE")
-RSA_PRIVATE_KEY_PATH = os.getenv("RSA_PRIVATE_KEY_PATH")
-MODEL = os.getenv("MODEL")
-
-# Environment Variable Validation
-required_env_vars = ["ACCOUNT", "HOST", "DEMO_USER", "DEMO_DATABASE", "DEMO_SCHEMA", "DEMO_USER_ROLE", "WAREHOUSE", "SLACK_APP_TOKEN", "SLACK_BOT_TOKEN", "AGENT_ENDPOINT", "SEMANTIC_MODEL", "SEARCH_SERVICE", "RSA_PRIVATE_KEY_PATH", "MODEL"]
-for var in required_env_vars:
-    if not os.getenv(var):
-        print(f"Error: Required environment variable '{var}' is not set. Please check your .env file.")
-        exit(1)
+try:
+    CFG = SFConfig.from_env()
+except KeyError as e:
+    print(f"Error: Required environment variable '{e.args[0]}' is not set. Please check your .env file.")
+    exit(1)
+
+# Optional: shared cache for agent responses and query results
+REDIS_HOST = os.getenv("REDIS_HOST")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 
 DEBUG = False
 
 # Initialize Slack App
-app = App(token=SLACK_BOT_TOKEN)
+app = App(token=CFG.slack_bot_token)
 
 # Global In-Memory Cache - Replace with Redis/database for production
-global_sql_cache = {}
+# The query behind each result message (SQL plus its fetched DataFrame) is bounded
+# and expires after an hour; cachetools caches are not thread-safe and Bolt
+# dispatches events on worker threads, so access goes through cache_put/cache_get
+# under _cache_lock
+_cache_lock = RLock()
+global_query_cache = TTLCache(maxsize=500, ttl=3600)
 global_dataframe_cache = {}
 global_original_dataframe_cache = {}
 global_current_filters_cache = {}
@@ -79,17 +92,127 @@ REFINE_PROMPT_MODAL_ACTION_ID = "refine_prompt_modal"
 RENDER_CHART_BUTTON_ACTION_ID = "ai_chart_button"
 DOWNLOAD_DATA_BUTTON_ACTION_ID = "download_data_button"
 ROW_LIMIT_DROPDOWN_ACTION_ID = "row_limit_select"
-
-last_user_prompt_global = ""
+# Stable block_ids for the result message's action buttons and SQL code blocks
+ACTIONS_BLOCK_ID = "cortex_actions"
+SQL_BLOCK_ID = "cortex_sql"
+
+# Last prompt per (user_id, channel_id), so concurrent users never refine or
+# chart each other's questions; guarded like the query cache
+_last_prompt_lock = RLock()
+_last_prompts = TTLCache(maxsize=10000, ttl=3600)
 global_refinement_cache = {}
-preserved_row_limit_for_refinement = None
 
+# Event ids already being answered; Slack redelivers events it thinks timed out
+_seen_event_lock = RLock()
+_seen_event_ids = TTLCache(maxsize=10000, ttl=600)
+
+
+
+@dataclass
+class CachedQuery:
+    """Agent SQL and the DataFrame it returned (entitlement-filtered, type-converted)"""
+    sql: str
+    df: pd.DataFrame
+    prompt: str = ""  # the user prompt that produced this result
+    truncated: bool = False  # df was capped at RESULT_ROW_CAP rows
+
+
+def cache_put(message_ts, entry):
+    """Store the CachedQuery behind a posted result message"""
+    with _cache_lock:
+        global_query_cache[message_ts] = entry
+
+
+def cache_get(message_ts):
+    """Return the CachedQuery behind a posted result message, or None if unknown or expired"""
+    with _cache_lock:
+        return global_query_cache.get(message_ts)
+
+
+def is_capped_result(message_ts):
+    """True if the message's data is the first RESULT_ROW_CAP rows of a larger result"""
+    cached_query = cache_get(message_ts)
+    return cached_query is not None and cached_query.truncated
+
+
+def remember_prompt(user_id, channel_id, prompt):
+    """Record the latest prompt a user sent in a channel"""
+    with _last_prompt_lock:
+        _last_prompts[(user_id, channel_id)] = prompt
+
+
+def prompt_for_message(message_ts, user_id, channel_id):
+    """
+    Return the prompt behind a result message: the one cached with its query,
+    falling back to the user's latest prompt in the channel ("" if neither is known).
+    """
+    cached_query = cache_get(message_ts)
+    if cached_query is not None and cached_query.prompt:
+        return cached_query.prompt
+    with _last_prompt_lock:
+        return _last_prompts.get((user_id, channel_id), "")
+
+
+# Redis cache (only when REDIS_HOST is set) shared across bot processes: agent
+# responses keyed by the normalized prompt, query results keyed by the
+# entitlement-filtered SQL (which embeds the user, so results never cross users)
+# Short timeouts so an unreachable Redis costs at most about a second before the
+# handlers fall back to Cortex/Snowflake, instead of the OS TCP timeout
+REDIS_CONNECT_TIMEOUT = 0.5  # seconds
+REDIS_SOCKET_TIMEOUT = 1.0  # seconds
+if REDIS_HOST:
+    import redis
+    redis_client = redis.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        decode_responses=False,
+        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+    )
+else:
+    redis = None  # optional dependency, only needed with REDIS_HOST
+    redis_client = None
+AGENT_RESPONSE_CACHE_TTL = 14400  # 4 hours
+QUERY_RESULT_CACHE_TTL = 3600  # 1 hour
+QUERY_RESULT_CACHE_MAX_BYTES = 8 * 1024 * 1024  # larger parquet payloads are not cached
+
+# Rows pulled into pandas when a result is first displayed. Row limits, filters
+# and charts work on this capped frame; Download re-runs the full query.
+RESULT_ROW_CAP = 10000
+CAPPED_RESULT_NOTE = f"\n\n(Large result: working with the first {RESULT_ROW_CAP:,} rows. Download Data fetches every row.)"
+CAPPED_CHART_NOTE = f" Charted from the first {RESULT_ROW_CAP:,} rows of a larger result."
 
 
+def _redis_key(prefix, text):
+    # Cache keys only need to be collision-resistant, not cryptographic; BLAKE2b is faster
+    return f"{prefix}:{hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()}"
+
+
+# Column-name keywords that mark a numeric column as currency for display formatting
+CURRENCY_COLUMN_PATTERN = re.compile(r'SALES|AMOUNT|REVENUE|TOTAL|COST|PRICE|VALUE')
+
 # Constants for Snowflake stored procedure parameters
 SNOWFLAKE_STAGE_PATH = '@"SLACK_SALES_DEMO"."SLACK_SCHEMA"."SLACK_SEMANTIC_MODELS"'
 SNOWFLAKE_FILE_NAME = 'sales_semantic_model.yaml'
 
+# REFINE_QUERY is called with server-side bind variables (the connection uses the
+# qmark paramstyle): the statement text is the same on every call so Snowflake can
+# reuse it, and prompts need no manual quote escaping
+REFINE_QUERY_CALL = f"CALL {CFG.database}.{CFG.schema}.REFINE_QUERY(?, ?, ?)"
+# Semantic model location is fixed for the life of the process
+REFINE_QUERY_FIXED_ARGS = (SNOWFLAKE_STAGE_PATH, SNOWFLAKE_FILE_NAME)
+
+
+def call_refine_query(user_prompt):
+    """
+    Calls the REFINE_QUERY stored procedure for a user prompt.
+    Returns the procedure's result, or None if it returned no row.
+    """
+    with snowflake_session() as conn, conn.cursor() as cur:
+        cur.execute(REFINE_QUERY_CALL, REFINE_QUERY_FIXED_ARGS + (user_prompt,))
+        result = cur.fetchone()
+    return result[0] if result else None
+
 
 # --- Entitlement-Based Security Functions ---
 
@@ -207,26 +330,8 @@ def background_refinement_analysis(user_prompt, message_ts, channel_id, app_clie
             print(f"🔍 Starting background refinement analysis for: '{user_prompt}'")
         
         # Call the existing refine query procedure (optimized)
-        cur = CONN.cursor()
-        try:
-            escaped_stage_path = SNOWFLAKE_STAGE_PATH.replace("'", "''")
-            escaped_user_prompt = user_prompt.replace("'", "''")
-            
-            sql_call_formatted = (
-                f"CALL {DATABASE}.{SCHEMA}.REFINE_QUERY("
-                f"'{escaped_stage_path}', "
-                f"'{SNOWFLAKE_FILE_NAME}', "
-                f"'{escaped_user_prompt}')"
-            )
-            
-            cur.execute(sql_call_formatted)
-            result = cur.fetchone()
-        finally:
-            cur.close()  # Ensure cursor is closed immediately
-        
-        if result:
-            refinement_message = result[0]
-        else:
+        refinement_message = call_refine_query(user_prompt)
+        if not refinement_message:
             refinement_message = "No refinement suggestions received."
         
         # Always log the refinement result for visibility
@@ -411,13 +516,63 @@ def add_smart_refinement_button(message_ts, channel_id, refinement_suggestion, a
 
 # --- Slack Message Handlers ---
 
+def post_progress(client, channel_id, emoji, text, ts=None):
+    """
+    Shows a bold one-line status message (rich_text for reliable bolding and emoji).
+    Posts a new message when ts is None; otherwise updates that message in place,
+    so a long-running action costs one post plus updates rather than extra messages.
+    Returns the message ts.
+    """
+    blocks = [
+        {
+            "type": "rich_text",
+            "elements": [
+                {
+                    "type": "rich_text_section",
+                    "elements": [
+                        {
+                            "type": "text",
+                            "text": emoji,
+                        },
+                        {
+                            "type": "text",
+                            "text": text,
+                            "style": {
+                                "bold": True
+                            }
+                        }
+                    ]
+                }
+            ]
+        }
+    ]
+    if ts is None:
+        return client.chat_postMessage(channel=channel_id, text=text, blocks=blocks)['ts']
+    client.chat_update(channel=channel_id, ts=ts, text=text, blocks=blocks)
+    return ts
+
+
+# Prompts are answered on this pool so the message listener returns as soon as the
+# "generating" notice is posted instead of holding a Bolt worker for the whole
+# agent call and query; its workers draw Snowflake connections from snowflake_session()
+PROMPT_WORKERS = 16
+_prompt_executor = ThreadPoolExecutor(max_workers=PROMPT_WORKERS, thread_name_prefix="cortex-prompt")
+
+# Threads the Socket Mode client uses to dispatch incoming envelopes. Button and
+# modal handlers still run Snowflake work inline, so allow more than the default 10
+# so one slow chart or download does not queue everyone else's clicks.
+SOCKET_MODE_CONCURRENCY = 32
+
+
 @app.event("message")
-def handle_message_events(ack, body, say):
-    global last_user_prompt_global
+def handle_message_events(ack, body, say, request):
     try:
         ack()
+        if request.headers.get('x-slack-retry-num') or is_duplicate_event(body.get('event_id')):
+            print(f"Skipping redelivered event {body.get('event_id')}")
+            return
         prompt = body['event']['text']
-        last_user_prompt_global = prompt
+        remember_prompt(body['event'].get('user'), body['event']['channel'], prompt)
         say(
             text = "Snowflake Cortex AI is generating a response",
             blocks=[
@@ -436,59 +591,238 @@ def handle_message_events(ack, body, say):
                 },
             ]
         )
+        _prompt_executor.submit(answer_prompt, prompt, body, say)
+    except Exception as e:
+        _say_request_failed(say, e)
+
+
+def is_duplicate_event(event_id):
+    """Record an event id; True if it was already seen within the TTL"""
+    if not event_id:
+        return False
+    with _seen_event_lock:
+        if event_id in _seen_event_ids:
+            return True
+        _seen_event_ids[event_id] = True
+        return False
+
+
+def answer_prompt(prompt, body, say, row_limit=None):
+    """
+    Sends the prompt to the agent and posts its response to the message's channel.
+    row_limit carries the row limit selected on the message being refined, if any.
+    """
+    try:
         response = ask_agent(prompt)
-        display_agent_response(response, say, app.client, body)
+        display_agent_response(response, say, app.client, body, row_limit)
     except Exception as e:
-        error_info = f"{type(e).__name__} at line {e.__traceback__.tb_lineno} of {__file__}: {e}"
-        print(f"ERROR: {error_info}")
-        say(
-            text = "Request failed...",
-            blocks=[
-                {
-                    "type": "divider"
-                },
-                {
-                    "type": "section",
-                    "text": {
-                        "type": "plain_text",
-                        "text": f"An unexpected error occurred: {type(e).__name__}. Please try again later or contact support if the issue persists.",
-                    }
-                },
-                {
-                    "type": "divider"
-                },
-            ]
-        )
+        _say_request_failed(say, e)
+
+
+def _say_request_failed(say, e):
+    error_info = f"{type(e).__name__} at line {e.__traceback__.tb_lineno} of {__file__}: {e}"
+    print(f"ERROR: {error_info}")
+    say(
+        text = "Request failed...",
+        blocks=[
+            {
+                "type": "divider"
+            },
+            {
+                "type": "section",
+                "text": {
+                    "type": "plain_text",
+                    "text": f"An unexpected error occurred: {type(e).__name__}. Please try again later or contact support if the issue persists.",
+                }
+            },
+            {
+                "type": "divider"
+            },
+        ]
+    )
 
 # --- Agent Interaction ---
 
 def ask_agent(prompt):
     """
     Sends the user prompt to the Cortex Chat Agent.
+    When Redis is configured, responses are reused for repeated prompts.
     """
-    resp = CORTEX_APP.chat(prompt)
+    if redis_client is None:
+        return get_cortex_app().chat(prompt)
+    
+    key = _redis_key("cortex:agent", prompt.strip().lower())
+    try:
+        cached = redis_client.get(key)
+    except redis.RedisError as e:
+        print(f"Agent response cache unavailable, calling Cortex directly: {e}")
+        return get_cortex_app().chat(prompt)
+    
+    if cached is not None:
+        print("Agent response cache: HIT")
+        return json.loads(cached)
+    
+    print("Agent response cache: MISS")
+    resp = get_cortex_app().chat(prompt)
+    if resp is not None:
+        try:
+            redis_client.setex(key, AGENT_RESPONSE_CACHE_TTL, json.dumps(resp))
+        except redis.RedisError as e:
+            print(f"Could not cache agent response: {e}")
     return resp
 
+
+QUERY_TIMEOUT_SECONDS = 300
+QUERY_POLL_MAX_INTERVAL = 1.0
+
+
+def _wait_for_query(conn, query_id):
+    """
+    Polls a query submitted with execute_async until it finishes, backing off up to
+    QUERY_POLL_MAX_INTERVAL. Raises on query errors; cancels it after QUERY_TIMEOUT_SECONDS.
+    """
+    deadline = time.monotonic() + QUERY_TIMEOUT_SECONDS
+    interval = 0.05
+    while conn.is_still_running(conn.get_query_status_throw_if_error(query_id)):
+        if time.monotonic() > deadline:
+            with conn.cursor() as cancel_cur:
+                cancel_cur.execute("SELECT SYSTEM$CANCEL_QUERY(?)", (query_id,))
+            raise TimeoutError(f"Snowflake query {query_id} did not finish within {QUERY_TIMEOUT_SECONDS}s")
+        time.sleep(interval)
+        interval = min(interval * 2, QUERY_POLL_MAX_INTERVAL)
+
+
+def _fetch_dataframe(sql):
+    """
+    Executes SQL on a connection checked out of the pool (snowflake_session()).
+    The query is submitted with execute_async and polled by _wait_for_query, which
+    cancels it after QUERY_TIMEOUT_SECONDS; the DataFrame is then built from the
+    connector's Arrow result batches (typed columns, no per-row Python tuples).
+    """
+    with snowflake_session() as conn, conn.cursor() as cur:
+        query_id = cur.execute_async(sql)["queryId"]
+        _wait_for_query(conn, query_id)
+        cur.get_results_from_sfqid(query_id)
+        return cur.fetch_pandas_all()
+
+
+def _strip_line_comment(line):
+    """Return line without a trailing -- comment, ignoring -- inside quoted literals"""
+    quote = None
+    for i, ch in enumerate(line):
+        if quote:
+            if ch == quote:
+                quote = None  # a doubled '' or "" just reopens on the next char
+        elif ch in ("'", '"'):
+            quote = ch
+        elif line.startswith("--", i):
+            return line[:i]
+    return line
+
+
+_SQL_ROW_LIMIT_CLAUSE_RE = re.compile(
+    r"\b(LIMIT\s+\d+(\s+OFFSET\s+\d+)?|FETCH\s+(FIRST|NEXT)\s+\d+\s+ROWS?\s+ONLY)\s*$",
+    re.IGNORECASE,
+)
+
+
+def _limit_sql(sql, limit):
+    """
+    Adds a server-side LIMIT to the query's outermost SELECT, so its ORDER BY still
+    decides which rows come back. The LIMIT goes on its own line so a trailing
+    -- comment cannot swallow it. Queries that already end in LIMIT/FETCH are
+    returned as they are (run_capped_query still caps them client-side).
+    """
+    lines = sql.rstrip().splitlines()
+    # Drop trailing blank and comment-only lines, then the statement terminator
+    while lines and (not lines[-1].strip() or lines[-1].lstrip().startswith("--")):
+        lines.pop()
+    if not lines:
+        return sql
+    last_code = _strip_line_comment(lines[-1]).rstrip()
+    if last_code.endswith(";"):
+        lines[-1] = last_code = last_code[:-1].rstrip()
+    query = "\n".join(lines)
+    if _SQL_ROW_LIMIT_CLAUSE_RE.search(last_code):
+        return query
+    return f"{query}\nLIMIT {limit}"
+
+
+def run_capped_query(sql, row_cap=RESULT_ROW_CAP):
+    """
+    Runs a SQL query capped at row_cap rows. One extra row is fetched to detect
+    truncation. Returns tuple: (df, truncated)
+    """
+    df = run_query(_limit_sql(sql, row_cap + 1))
+    if len(df) > row_cap:
+        return df.head(row_cap), True
+    return df, False
+
+
+def run_query(sql):
+    """
+    Runs a SQL query and returns the result as a DataFrame.
+    When Redis is configured, results up to RESULT_ROW_CAP rows and
+    QUERY_RESULT_CACHE_MAX_BYTES of parquet are cached keyed by the SQL text.
+    """
+    if redis_client is None:
+        return _fetch_dataframe(sql)
+    
+    key = _redis_key("cortex:result", sql)
+    try:
+        cached = redis_client.get(key)
+    except redis.RedisError as e:
+        print(f"Query result cache unavailable: {e}")
+        cached = None
+    
+    if cached is not None:
+        print("Query result cache: HIT")
+        return pd.read_parquet(io.BytesIO(cached))
+    
+    print("Query result cache: MISS")
+    df = _fetch_dataframe(sql)
+    # Only display-sized results are cached; uncapped Download re-runs can be huge
+    if len(df) > RESULT_ROW_CAP + 1:
+        print(f"Query result not cached: {len(df):,} rows exceeds {RESULT_ROW_CAP + 1:,}")
+        return df
+    try:
+        parquet_buffer = io.BytesIO()
+        df.to_parquet(parquet_buffer, index=False)
+        payload = parquet_buffer.getvalue()
+        if len(payload) > QUERY_RESULT_CACHE_MAX_BYTES:
+            print(f"Query result not cached: {len(payload):,} bytes exceeds {QUERY_RESULT_CACHE_MAX_BYTES:,}")
+        else:
+            redis_client.setex(key, QUERY_RESULT_CACHE_TTL, payload)
+    except Exception as e:
+        print(f"Could not cache query result: {e}")
+    return df
+
 # --- Helper for SQL display blocks ---
+# Static Block Kit pieces are built once at import and shared between messages.
+# The Slack client serializes them per request, so they must never be mutated.
+_SQL_QUERY_LABEL_SECTION = {
+    "type": "rich_text_section",
+    "elements": [
+        {
+            "type": "text",
+            "text": "SQL Query:",
+            "style": {
+                "bold": True
+            }
+        }
+    ]
+}
+
+
 def get_sql_code_block(sql_query):
     """
     Generates Slack rich_text block for displaying a SQL query as code.
     """
     return {
         "type": "rich_text",
+        "block_id": SQL_BLOCK_ID,
         "elements": [
-            {
-                "type": "rich_text_section",
-                "elements": [
-                    {
-                        "type": "text",
-                        "text": "SQL Query:",
-                        "style": {
-                            "bold": True
-                        }
-                    }
-                ]
-            },
+            _SQL_QUERY_LABEL_SECTION,
             {
                 "type": "rich_text_preformatted",
                 "elements": [
@@ -504,20 +838,23 @@ def get_sql_code_block(sql_query):
 
 
 # Helper for Show SQL Query button element
+_SHOW_SQL_QUERY_BUTTON_ELEMENT = {
+    "type": "button",
+    "text": {
+        "type": "plain_text",
+        "text": "Show SQL Query",
+        "emoji": True
+    },
+    # MODIFIED: Removed style property to allow default (white) color
+    "action_id": SQL_SHOW_BUTTON_ACTION_ID
+}
+
+
 def get_show_sql_query_button_element():
     """
     Returns the Slack Block Kit element for the "Show SQL Query" button.
     """
-    return {
-        "type": "button",
-        "text": {
-            "type": "plain_text",
-            "text": "Show SQL Query",
-            "emoji": True
-        },
-        # MODIFIED: Removed style property to allow default (white) color
-        "action_id": SQL_SHOW_BUTTON_ACTION_ID
-    }
+    return _SHOW_SQL_QUERY_BUTTON_ELEMENT
 
 # Helper for Row Limit dropdown element
 def get_row_limit_dropdown_element(data_size=None, selected_value=None):
@@ -525,8 +862,8 @@ def get_row_limit_dropdown_element(data_size=None, selected_value=None):
     Returns the Slack Block Kit element for the row limit dropdown.
     Always defaults to 10 rows and never shows more options than total rows.
     """
-    # Use selected_value if provided, otherwise preserved row limit, otherwise default to 10 rows
-    default_value = str(selected_value or preserved_row_limit_for_refinement or 10)
+    # Use selected_value if provided, otherwise default to 10 rows
+    default_value = str(selected_value or 10)
     
     # Base options for common viewing sizes
     base_options = [10, 25, 50, 100, 250, 500]
@@ -580,45 +917,61 @@ def get_row_limit_dropdown_element(data_size=None, selected_value=None):
 
 
 # Helper for Render Chart button element (AI-powered)
+_RENDER_CHART_BUTTON_ELEMENT = {
+    "type": "button",
+    "text": {
+        "type": "plain_text",
+        "text": "AI Chart",
+        "emoji": True
+    },
+    "style": "primary",
+    "action_id": RENDER_CHART_BUTTON_ACTION_ID
+}
+
+
 def get_render_chart_button_element():
     """
     Returns the Slack Block Kit element for the "Render Chart" button (AI-powered).
     """
-    return {
-        "type": "button",
-        "text": {
-            "type": "plain_text",
-            "text": "AI Chart",
-            "emoji": True
-        },
-        "style": "primary",
-        "action_id": RENDER_CHART_BUTTON_ACTION_ID
-    }
+    return _RENDER_CHART_BUTTON_ELEMENT
 
 # NEW: Helper for Download Data button element
+_DOWNLOAD_DATA_BUTTON_ELEMENT = {
+    "type": "button",
+    "text": {
+        "type": "plain_text",
+        "text": "Download Data",
+        "emoji": True
+    },
+    "style": "primary",
+    "action_id": DOWNLOAD_DATA_BUTTON_ACTION_ID
+}
+
+
 def get_download_data_button_element():
     """
     Returns the Slack Block Kit element for the "Download Data" button.
     """
-    return {
-        "type": "button",
-        "text": {
-            "type": "plain_text",
-            "text": "Download Data",
-            "emoji": True
-        },
-        "style": "primary",
-        "action_id": DOWNLOAD_DATA_BUTTON_ACTION_ID
-    }
+    return _DOWNLOAD_DATA_BUTTON_ELEMENT
+
+_REFINE_PROMPT_BUTTON_ELEMENT = {
+    "type": "button",
+    "text": {"type": "plain_text", "text": "Refine Prompt"},
+    "style": "danger",  # Red button to indicate needs attention
+    "action_id": REFINE_PROMPT_MODAL_ACTION_ID
+}
+
 
 def get_refine_prompt_button_element():
     """Returns the 'Refine Prompt' button element for modal-based refinement"""
-    return {
-        "type": "button",
-        "text": {"type": "plain_text", "text": "Refine Prompt"},
-        "style": "danger",  # Red button to indicate needs attention
-        "action_id": REFINE_PROMPT_MODAL_ACTION_ID
-    }
+    return _REFINE_PROMPT_BUTTON_ELEMENT
+
+# Buttons present on every actions block, in display order
+_COMMON_ACTION_BUTTONS = (
+    get_filter_data_button_element(),
+    _RENDER_CHART_BUTTON_ELEMENT,
+    _DOWNLOAD_DATA_BUTTON_ELEMENT
+)
 
 def _format_refinement_suggestions(suggestions):
     """Format refinement suggestions for better readability in the modal"""
@@ -754,11 +1107,7 @@ def get_action_buttons_block(include_show_sql=True, data_size=None, include_row_
     if include_show_sql: # Only add if requested
         elements.append(get_show_sql_query_button_element())
 
-    elements.extend([
-        get_filter_data_button_element(),
-        get_render_chart_button_element(),
-        get_download_data_button_element()
-    ])
+    elements.extend(_COMMON_ACTION_BUTTONS)
     
     # Add "Refine Prompt" button if refinement is needed
     if include_refine_prompt:
@@ -766,6 +1115,7 @@ def get_action_buttons_block(include_show_sql=True, data_size=None, include_row_
 
     return {
         "type": "actions",
+        "block_id": ACTIONS_BLOCK_ID,
         "elements": elements
     }
 
@@ -780,8 +1130,7 @@ def _format_dataframe_for_display(df):
     for col in formatted_df.columns:
         if pd.api.types.is_numeric_dtype(formatted_df[col]):
             # Check if this looks like a currency/sales column
-            is_currency = any(keyword in col.upper() for keyword in 
-                            ['SALES', 'AMOUNT', 'REVENUE', 'TOTAL', 'COST', 'PRICE', 'VALUE'])
+            is_currency = CURRENCY_COLUMN_PATTERN.search(col.upper()) is not None
             
             # Format numeric columns
             if is_currency:
@@ -800,6 +1149,41 @@ def _format_dataframe_for_display(df):
     return formatted_df
 
 
+def _format_table_text(df):
+    """
+    Render a small DataFrame as right-aligned plain text, like to_string(index=False)
+    without the pandas formatter overhead on every message.
+    """
+    columns = []
+    for col in df.columns:
+        series = df[col]
+        mask = series.notna()
+        present = series[mask]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            if series.dt.tz is not None:
+                # Like to_string, tz-aware values always keep their time and UTC offset
+                values = present.map(lambda ts: ts.isoformat(sep=" "))
+            elif (present == present.dt.normalize()).all():
+                # Like to_string, naive dates without a time part print as plain dates
+                values = present.dt.strftime("%Y-%m-%d")
+            elif (present.dt.microsecond == 0).all():
+                values = present.dt.strftime("%Y-%m-%d %H:%M:%S")
+            else:
+                values = present.dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+        else:
+            values = present.astype(str)
+        # Missing values (NaN, None, NaT) display as blanks
+        cells = [""] * len(series)
+        for position, value in zip(mask.to_numpy().nonzero()[0], values.tolist()):
+            cells[position] = value
+        columns.append([str(col)] + cells)
+
+    widths = [max(len(cell) for cell in cells) for cells in columns]
+    return "\n".join(
+        " ".join(cell.rjust(width) for cell, width in zip(row, widths))
+        for row in zip(*columns)
+    )
+
 def _get_safe_table_text(df, truncated_message="", requested_rows=None):
     """
     Get table text that's safe for Slack's character limits.
@@ -818,7 +1202,7 @@ def _get_safe_table_text(df, truncated_message="", requested_rows=None):
     # Format numeric columns with commas and currency symbols
     display_df = _format_dataframe_for_display(display_df)
     
-    base_table_text = display_df.to_string(index=False)
+    base_table_text = _format_table_text(display_df)
     
     # Calculate space needed for row counter message
     if max_rows < len(df):
@@ -848,7 +1232,7 @@ def _get_safe_table_text(df, truncated_message="", requested_rows=None):
                 
             display_df = df.head(fallback_rows).copy()
             display_df = _format_dataframe_for_display(display_df)
-            base_table_text = display_df.to_string(index=False)
+            base_table_text = _format_table_text(display_df)
             row_message = f"\n\n(Showing {fallback_rows:,} of {len(df):,} rows - reduced from {requested_rows:,} due to Slack size limits.)"
             full_text = base_table_text + truncated_message + row_message
             
@@ -860,7 +1244,7 @@ def _get_safe_table_text(df, truncated_message="", requested_rows=None):
     while safe_rows > 3:
         display_df = df.head(safe_rows).copy()
         display_df = _format_dataframe_for_display(display_df)
-        base_table_text = display_df.to_string(index=False)
+        base_table_text = _format_table_text(display_df)
         row_message = f"\n\n(Showing {safe_rows:,} of {len(df):,} rows - reduced due to Slack size limits.)"
         full_text = base_table_text + truncated_message + row_message
         
@@ -872,19 +1256,21 @@ def _get_safe_table_text(df, truncated_message="", requested_rows=None):
     # If even 3 rows is too long (very wide table), truncate the text
     display_df = df.head(3).copy()
     display_df = _format_dataframe_for_display(display_df)
-    table_text = display_df.to_string(index=False)
+    table_text = _format_table_text(display_df)
     if len(table_text) > 2700:
         table_text = table_text[:2700] + "..."
     table_text += f"\n\n(Table truncated for Slack display. Use dropdown to adjust.)"
     
     return table_text, 3
 
-def display_agent_response(content, say, app_client, original_body):
+def display_agent_response(content, say, app_client, original_body, row_limit=None):
     """
     Displays the agent's response, handling both SQL results (with charts)
-    and unstructured text responses.
+    and unstructured text responses. row_limit, when set (refined prompts),
+    overrides the default number of table rows shown.
     """
     channel_id = original_body['event']['channel']
+    user_prompt = original_body['event']['text']
 
     final_blocks = []
 
@@ -925,53 +1311,15 @@ def display_agent_response(content, say, app_client, original_body):
         # Apply entitlement-based filtering to ALL queries
         filtered_sql = apply_entitlement_filter(sql)
 
-        df = pd.read_sql(filtered_sql, CONN)
+        df, truncated = run_capped_query(filtered_sql)
+        if truncated:
+            print(f"Query result capped at {RESULT_ROW_CAP:,} rows for display")
 
         if DEBUG:
             print("Original DataFrame info:")
             df.info()
 
-        # --- Robust Type Conversion for Plotting ---
-        if len(df.columns) >= 2:
-            try:
-                if pd.api.types.is_object_dtype(df.iloc[:, 0]) or pd.api.types.is_string_dtype(df.iloc[:, 0]):
-                    temp_col = pd.to_datetime(df.iloc[:, 0], errors='coerce')
-                    if not temp_col.isna().all():
-                        df[df.columns[0]] = temp_col
-                        if DEBUG:
-                            print(f"Converted column '{df.columns[0]}' to datetime where possible.")
-            except Exception as e:
-                if DEBUG:
-                    print(f"Could not convert column '{df.columns[0]}' to datetime: {e}")
-
-            for i in range(len(df.columns)):
-                try:
-                    if pd.api.types.is_object_dtype(df.iloc[:, i]) or pd.api.types.is_string_dtype(df.iloc[:, i]):
-                        temp_col = pd.to_numeric(df.iloc[:, i], errors='coerce')
-                        if not temp_col.isna().all() and (temp_col.notna().sum() / len(temp_col) > 0.5):
-                            df[df.columns[i]] = temp_col
-                            if DEBUG:
-                                print(f"Converted column '{df.columns[i]}' to numeric where possible.")
-                    elif pd.api.types.is_numeric_dtype(df.iloc[:, i]):
-                        # Only convert to float if the column contains decimal values
-                        if not df[df.columns[i]].apply(lambda x: x == int(x) if pd.notna(x) else True).all():
-                            df[df.columns[i]] = df[df.columns[i]].astype(float)
-                            if DEBUG:
-                                print(f"Kept column '{df.columns[i]}' as float (contains decimals)")
-                        else:
-                            df[df.columns[i]] = df[df.columns[i]].astype(int)
-                            if DEBUG:
-                                print(f"Converted column '{df.columns[i]}' to int (whole numbers only)")
-                except Exception as e:
-                    if DEBUG:
-                        print(f"Could not convert column '{df.columns[i]}' to numeric: {e}")
-
-        for col in df.columns:
-            if pd.api.types.is_numeric_dtype(df[col]):
-                if df[col].isnull().any():
-                    df.dropna(subset=[col], inplace=True)
-                    if DEBUG:
-                        print(f"Dropped rows with NaN in numeric column '{col}'.")
+        df = coerce_for_plot(df)
 
         if DEBUG:
             print("\nDataFrame after type conversion info:")
@@ -1004,7 +1352,7 @@ def display_agent_response(content, say, app_client, original_body):
             
             # Cache the empty DataFrame and SQL for potential button interactions
             global_dataframe_cache[message_ts] = df
-            global_sql_cache[message_ts] = sql
+            cache_put(message_ts, CachedQuery(sql, df, user_prompt, truncated))
             global_original_dataframe_cache[message_ts] = df.copy()
             
             return
@@ -1066,7 +1414,7 @@ def display_agent_response(content, say, app_client, original_body):
                         "elements": [
                             {
                                 "type": "text",
-                                "text": _get_safe_table_text(display_df, "", preserved_row_limit_for_refinement or min(len(df), 10))[0]
+                                "text": _get_safe_table_text(display_df, CAPPED_RESULT_NOTE if truncated else "", row_limit or min(len(df), 10))[0]
                             }
                         ]
                     }
@@ -1074,9 +1422,9 @@ def display_agent_response(content, say, app_client, original_body):
             })
 
         # Add the combined action buttons block initially without refinement button
-        # Use preserved row limit if available (for refined prompts), otherwise use data size for smart default
-        display_limit = preserved_row_limit_for_refinement or len(df)
-        final_blocks.append(get_action_buttons_block(include_show_sql=True, data_size=display_limit, include_refine_prompt=False))
+        # Use the refined prompt's row limit if given, otherwise use data size for smart default
+        display_limit = row_limit or len(df)
+        final_blocks.append(get_action_buttons_block(include_show_sql=True, data_size=display_limit, include_refine_prompt=False, selected_row_limit=row_limit))
 
         # Send the initial message and capture its timestamp (ts)
         try:
@@ -1090,7 +1438,7 @@ def display_agent_response(content, say, app_client, original_body):
             # Background thread will add refinement button if needed - no need to check immediately
 
             # Store the full SQL query and DataFrame in the global cache, keyed by message_ts
-            global_sql_cache[message_ts] = sql
+            cache_put(message_ts, CachedQuery(sql, df, user_prompt, truncated))
             global_dataframe_cache[message_ts] = df
             global_original_dataframe_cache[message_ts] = df.copy()  # Store original unfiltered data
             
@@ -1098,7 +1446,7 @@ def display_agent_response(content, say, app_client, original_body):
             import threading
             threading.Thread(
                 target=background_refinement_analysis,
-                args=(last_user_prompt_global, message_ts, channel_id, app_client),
+                args=(user_prompt, message_ts, channel_id, app_client),
                 daemon=True
             ).start()
 
@@ -1148,6 +1496,34 @@ def display_agent_response(content, say, app_client, original_body):
         )
 
 # --- Action handler for "Show SQL Query" button ---
+_RESULT_ACTION_IDS = frozenset([
+    REFINE_QUERY_BUTTON_ACTION_ID, REFINE_PROMPT_MODAL_ACTION_ID, SQL_SHOW_BUTTON_ACTION_ID,
+    RENDER_CHART_BUTTON_ACTION_ID, DOWNLOAD_DATA_BUTTON_ACTION_ID, ROW_LIMIT_DROPDOWN_ACTION_ID,
+])
+
+
+def _is_actions_block(block):
+    """True for the result message's action buttons block"""
+    if block.get("block_id") == ACTIONS_BLOCK_ID:
+        return True
+    # Messages posted before the block_ids existed: recognise it by its action_ids
+    return block.get("type") == "actions" and any(
+        e.get("action_id") in _RESULT_ACTION_IDS for e in block.get("elements", [])
+    )
+
+
+def _is_sql_block(block):
+    """True for the SQL code block added by Show SQL Query"""
+    if block.get("block_id") == SQL_BLOCK_ID:
+        return True
+    # Messages posted before the block_ids existed: recognise it by its label
+    return block.get("type") == "rich_text" and any(
+        el.get("type") == "rich_text_section"
+        and any(item.get("text") == "SQL Query:" for item in el.get("elements", []))
+        for el in block.get("elements", [])
+    )
+
+
 @app.action(SQL_SHOW_BUTTON_ACTION_ID)
 def handle_show_sql_query(ack, body, client):
     ack()
@@ -1156,25 +1532,16 @@ def handle_show_sql_query(ack, body, client):
     channel_id = body['channel']['id']
 
     # Retrieve the SQL query from the cache using the message's timestamp
-    sql_query = global_sql_cache.get(message_ts)
+    cached_query = cache_get(message_ts)
+    sql_query = cached_query.sql if cached_query else None
 
     current_blocks = body['message']['blocks']
 
-    blocks_to_rebuild = []
-    sql_already_displayed = False
-
-    for block in current_blocks:
-        # Filter out the existing action buttons block
-        if block.get("type") == "actions" and any(e.get('action_id') in [REFINE_QUERY_BUTTON_ACTION_ID, REFINE_PROMPT_MODAL_ACTION_ID, SQL_SHOW_BUTTON_ACTION_ID, RENDER_CHART_BUTTON_ACTION_ID, DOWNLOAD_DATA_BUTTON_ACTION_ID, ROW_LIMIT_DROPDOWN_ACTION_ID] for e in block['elements']):
-            # This is our action buttons block, we will re-add a modified version later
-            continue
-        # Check if the SQL is already in the message (e.g., if button was clicked twice)
-        if block.get("type") == "rich_text" and any(el.get("text") == "SQL Query:" for el in block.get("elements", []) if el.get("type") == "rich_text_section"):
-            sql_already_displayed = True
-            # We don't continue here directly because we might want to keep other blocks before and after SQL
-        blocks_to_rebuild.append(block)
+    # Check if the SQL is already in the message (e.g., if button was clicked twice)
+    sql_already_displayed = any(_is_sql_block(block) for block in current_blocks)
 
-    updated_blocks = blocks_to_rebuild[:]
+    # Filter out the existing action buttons block, we will re-add a modified version later
+    updated_blocks = [block for block in current_blocks if not _is_actions_block(block)]
 
     if sql_query and not sql_already_displayed:
         # Insert the full SQL query blocks
@@ -1229,9 +1596,9 @@ def handle_row_limit_change(ack, body, client):
         if DEBUG:
             print(f"Row limit change: Using cached DataFrame with {len(df)} rows")
     else:
-        # Fall back to SQL query for original results
-        sql_query = global_sql_cache.get(message_ts)
-        if not sql_query:
+        # Fall back to the DataFrame fetched with the original query
+        cached_query = cache_get(message_ts)
+        if cached_query is None:
             client.chat_postMessage(
                 channel=channel_id,
                 text="Sorry, the query data is no longer available. Please run your query again.",
@@ -1240,37 +1607,9 @@ def handle_row_limit_change(ack, body, client):
             )
             return
         
-        try:
-            # Re-execute the SQL query with entitlement filtering
-            filtered_sql = apply_entitlement_filter(sql_query)
-            df = pd.read_sql(filtered_sql, CONN)
-            if DEBUG:
-                print(f"Row limit change: Re-executed SQL query, got {len(df)} rows")
-            
-            # Apply the same type conversion logic as the initial display
-            if len(df.columns) >= 2:
-                for i in range(len(df.columns)):
-                    try:
-                        if pd.api.types.is_object_dtype(df.iloc[:, i]) or pd.api.types.is_string_dtype(df.iloc[:, i]):
-                            temp_col = pd.to_numeric(df.iloc[:, i], errors='coerce')
-                            if not temp_col.isna().all() and (temp_col.notna().sum() / len(temp_col) > 0.5):
-                                df[df.columns[i]] = temp_col
-                        elif pd.api.types.is_numeric_dtype(df.iloc[:, i]):
-                            # Only convert to float if the column contains decimal values
-                            if not df[df.columns[i]].apply(lambda x: x == int(x) if pd.notna(x) else True).all():
-                                df[df.columns[i]] = df[df.columns[i]].astype(float)
-                            else:
-                                df[df.columns[i]] = df[df.columns[i]].astype(int)
-                    except Exception as e:
-                        pass  # Silently continue if conversion fails
-        except Exception as e:
-            client.chat_postMessage(
-                channel=channel_id,
-                text=f"Error re-executing query: {e}",
-    
-                ephemeral=True
-            )
-            return
+        df = cached_query.df.copy(deep=False)
+        if DEBUG:
+            print(f"Row limit change: Using cached query result with {len(df)} rows")
     
     try:
         
@@ -1328,7 +1667,8 @@ def handle_row_limit_change(ack, body, client):
         
         # Add the new table block with limited rows using safe text function
         # Note: _get_safe_table_text handles all row count messages internally and limiting
-        safe_table_content, actual_rows_displayed = _get_safe_table_text(df, "", selected_limit)
+        capped_note = CAPPED_RESULT_NOTE if is_capped_result(message_ts) else ""
+        safe_table_content, actual_rows_displayed = _get_safe_table_text(df, capped_note, selected_limit)
         table_text = f"```\n{safe_table_content}\n```"
         
         updated_blocks.append({
@@ -1371,8 +1711,9 @@ def handle_refine_query_button_click(ack, body, client):
 
     message_ts = body['message']['ts']
     channel_id = body['channel']['id']
+    user_prompt = prompt_for_message(message_ts, body['user']['id'], channel_id)
 
-    if not last_user_prompt_global:
+    if not user_prompt:
         client.chat_postMessage(
             channel=channel_id,
             text="Sorry, I couldn't retrieve the last prompt to refine. Please try inputing another prompt.",
@@ -1397,7 +1738,7 @@ def handle_refine_query_button_click(ack, body, client):
                                 },
                                 {
                                     "type": "text",
-                                    "text": f"Refining prompt for: '{last_user_prompt_global}'...",
+                                    "text": f"Refining prompt for: '{user_prompt}'...",
                                     "style": {
                                         "bold": True
                                     }
@@ -1410,30 +1751,11 @@ def handle_refine_query_button_click(ack, body, client):
 
         )
 
-        cur = CONN.cursor()
-
-        escaped_stage_path = SNOWFLAKE_STAGE_PATH.replace("'", "''")
-        escaped_file_name = SNOWFLAKE_FILE_NAME.replace("'", "''")
-        escaped_user_prompt = last_user_prompt_global.replace("'", "''")
-
-        # Using DATABASE and SCHEMA environment variables for consistency
-        sql_call_formatted = (
-            f"CALL {DATABASE}.{SCHEMA}.REFINE_QUERY("
-            f"'{escaped_stage_path}', "
-            f"'{escaped_file_name}', "
-            f"'{escaped_user_prompt}')"
-        )
-
         if DEBUG:
-            print(f"DEBUG: Attempting to call with formatted SQL: {sql_call_formatted}")
-
-        cur.execute(sql_call_formatted)
-
-        result = cur.fetchone()
+            print(f"DEBUG: Calling {REFINE_QUERY_CALL} for prompt: {user_prompt}")
 
-        if result:
-            refinement_message = result[0]
-        else:
+        refinement_message = call_refine_query(user_prompt)
+        if not refinement_message:
             refinement_message = "No refinement suggestions received from Cortex."
 
         # Post the refinement result with action buttons
@@ -1458,8 +1780,9 @@ def handle_refine_query_button_click(ack, body, client):
         refine_message_ts = refine_response['ts']
         if message_ts in global_dataframe_cache:
             global_dataframe_cache[refine_message_ts] = global_dataframe_cache[message_ts]
-        if message_ts in global_sql_cache:
-            global_sql_cache[refine_message_ts] = global_sql_cache[message_ts]
+        cached_query = cache_get(message_ts)
+        if cached_query is not None:
+            cache_put(refine_message_ts, cached_query)
         if message_ts in global_original_dataframe_cache:
             global_original_dataframe_cache[refine_message_ts] = global_original_dataframe_cache[message_ts]
 
@@ -1471,9 +1794,6 @@ def handle_refine_query_button_click(ack, body, client):
             text=f"An error occurred while trying to refine the prompt: {e}",
 
         )
-    finally:
-        if 'cur' in locals() and cur:
-            cur.close()
 
 # Action handler for "Refine Prompt" modal button
 @app.action(REFINE_PROMPT_MODAL_ACTION_ID)
@@ -1488,8 +1808,9 @@ def handle_refine_prompt_modal_click(ack, body, client):
     channel_id = body['channel']['id']
     user_id = body['user']['id']
     trigger_id = body['trigger_id']
+    user_prompt = prompt_for_message(message_ts, user_id, channel_id)
 
-    if not last_user_prompt_global:
+    if not user_prompt:
         client.chat_postMessage(
             channel=channel_id,
             text="Sorry, I couldn't retrieve the last prompt to refine. Please try another prompt."
@@ -1503,29 +1824,12 @@ def handle_refine_prompt_modal_click(ack, body, client):
             refinement_suggestions = refinement_info["suggestions"]
         else:
             # Fallback: call Snowflake if cache is missing
-            cur = CONN.cursor()
-            escaped_stage_path = SNOWFLAKE_STAGE_PATH.replace("'", "''")
-            escaped_file_name = SNOWFLAKE_FILE_NAME.replace("'", "''")
-            escaped_user_prompt = last_user_prompt_global.replace("'", "''")
-
-            sql_call_formatted = (
-                f"CALL {DATABASE}.{SCHEMA}.REFINE_QUERY("
-                f"'{escaped_stage_path}', "
-                f"'{escaped_file_name}', "
-                f"'{escaped_user_prompt}')"
-            )
-
-            cur.execute(sql_call_formatted)
-            result = cur.fetchone()
-            cur.close()
-
-            if result:
-                refinement_suggestions = result[0]
-            else:
+            refinement_suggestions = call_refine_query(user_prompt)
+            if not refinement_suggestions:
                 refinement_suggestions = "No specific suggestions available. Consider being more specific about time periods, metrics, or filters."
 
         # Create and open the modal
-        modal_view = create_refine_prompt_modal(last_user_prompt_global, refinement_suggestions)
+        modal_view = create_refine_prompt_modal(user_prompt, refinement_suggestions)
         
         # Store the original message context for the modal submission
         modal_view["private_metadata"] = f"{message_ts}|{channel_id}"
@@ -1550,15 +1854,17 @@ def handle_render_chart_button_click(ack, body, client):
     message_ts = body['message']['ts']
     channel_id = body['channel']['id']
 
-    sql_query = global_sql_cache.get(message_ts)
+    cached_query = cache_get(message_ts)
 
-    if not sql_query:
+    if cached_query is None:
         client.chat_postMessage(
             channel=channel_id,
             text="Sorry, I couldn't retrieve the data for AI charting. The query might have expired or been cleared.",
         )
         return
 
+    user_prompt = prompt_for_message(message_ts, body['user']['id'], channel_id)
+
     try:
         # Get the current DataFrame (the data the user is looking at)
         df = global_dataframe_cache.get(message_ts)
@@ -1570,47 +1876,22 @@ def handle_render_chart_button_click(ack, body, client):
             )
             return
         
-        # Show progress message
-        analyzing_response = client.chat_postMessage(
-            channel=channel_id,
-            blocks=[
-                {
-                    "type": "rich_text",
-                    "elements": [
-                        {
-                            "type": "rich_text_section",
-                            "elements": [
-                                {
-                                    "type": "text",
-                                    "text": "🤖 ", 
-                                },
-                                {
-                                    "type": "text",
-                                    "text": "AI is analyzing your data and creating an intelligent chart...",
-                                    "style": {
-                                        "bold": True
-                                    }
-                                }
-                            ]
-                        }
-                    ]
-                }
-            ],
-        )
-        analyzing_ts = analyzing_response['ts']
+        # Show progress message (updated in place with the outcome below)
+        analyzing_ts = post_progress(client, channel_id, "🤖 ", "AI is analyzing your data and creating an intelligent chart...")
         
         if DEBUG:
             print(f"AI Chart: Using DataFrame with {len(df)} rows")
             print(f"AI Chart: DataFrame shape: {df.shape}")
             print(f"AI Chart: DataFrame columns: {list(df.columns)}")
-            print(f"AI Chart: User prompt: {last_user_prompt_global}")
+            print(f"AI Chart: User prompt: {user_prompt}")
 
-        # Create Snowpark session from existing connection
+        # Create Snowpark session from a pooled connection, held while the chart is generated
         from snowflake.snowpark import Session
-        session = Session.builder.configs({"connection": CONN}).create()
-        
-        # Use AI-powered charting with the original user prompt
-        fig = ai_plot(session, last_user_prompt_global, df)
+        with snowflake_session() as conn:
+            session = Session.builder.configs({"connection": conn}).create()
+            
+            # Use AI-powered charting with the original user prompt
+            fig = ai_plot(session, user_prompt, df)
         
         if fig:
             # Convert to image and upload to Slack
@@ -1638,73 +1919,25 @@ def handle_render_chart_button_click(ack, body, client):
             except Exception as render_error:
                 print(f"⚠️ Chart rendering failed: {str(render_error)}")
                 # Post friendly error message to Slack using exact same rich_text structure as original message
-                client.chat_update(
-                    channel=channel_id,
-                    ts=analyzing_ts,
-                    text="❌ AI Chart generation failed",
-                    blocks=[
-                        {
-                            "type": "rich_text",
-                            "elements": [
-                                {
-                                    "type": "rich_text_section",
-                                    "elements": [
-                                        {
-                                            "type": "text",
-                                            "text": "❌ ",
-                                        },
-                                        {
-                                            "type": "text",
-                                            "text": f"AI Chart generation failed due to data type conflicts.\n\nDataset: {len(df):,} rows\n\nThis issue has been fixed - please try again!",
-                                            "style": {
-                                                "bold": True
-                                            }
-                                        }
-                                    ]
-                                }
-                            ]
-                        }
-                    ]
+                post_progress(
+                    client, channel_id, "❌ ",
+                    f"AI Chart generation failed due to data type conflicts.\n\nDataset: {len(df):,} rows\n\nThis issue has been fixed - please try again!",
+                    ts=analyzing_ts
                 )
                 return  # Exit early, don't try to process upload
             
             if upload_response.get('ok'):
                 # Update the original "analyzing" message with completion status (using same rich_text structure)
-                chart_blocks = [
-                    {
-                        "type": "rich_text",
-                        "elements": [
-                            {
-                                "type": "rich_text_section",
-                                "elements": [
-                                    {
-                                        "type": "text",
-                                        "text": "✅ ", 
-                                    },
-                                    {
-                                        "type": "text",
-                                        "text": "AI Chart Complete! The chart below was intelligently selected based on your data and question.",
-                                        "style": {
-                                            "bold": True
-                                        }
-                                    }
-                                ]
-                            }
-                        ]
-                    }
-                ]
-                
-                chart_response = client.chat_update(
-                    channel=channel_id,
-                    ts=analyzing_ts,
-                    text="AI Chart Complete",
-                    blocks=chart_blocks
+                chart_message_ts = post_progress(
+                    client, channel_id, "✅ ",
+                    "AI Chart Complete! The chart below was intelligently selected based on your data and question."
+                    + (CAPPED_CHART_NOTE if cached_query.truncated else ""),
+                    ts=analyzing_ts
                 )
                 
                 # Cache the DataFrame for the chart message so buttons work
-                chart_message_ts = chart_response['ts']
                 global_dataframe_cache[chart_message_ts] = df
-                global_sql_cache[chart_message_ts] = global_sql_cache.get(message_ts)
+                cache_put(chart_message_ts, cached_query)
                 global_original_dataframe_cache[chart_message_ts] = global_original_dataframe_cache.get(message_ts)
                 
                 if DEBUG:
@@ -1735,9 +1968,9 @@ def handle_download_data_button_click(ack, body, client):
     message_ts = body['message']['ts']
     channel_id = body['channel']['id']
 
-    sql_query = global_sql_cache.get(message_ts)
+    cached_query = cache_get(message_ts)
 
-    if not sql_query:
+    if cached_query is None:
         client.chat_postMessage(
             channel=channel_id,
             text="Sorry, I couldn't retrieve the data for download. The query might have expired or been cleared.",
@@ -1746,38 +1979,18 @@ def handle_download_data_button_click(ack, body, client):
         return
 
     try:
-        # MODIFIED: Used rich_text blocks for reliable bolding and emoji
-        client.chat_postMessage(
-            channel=channel_id,
-            blocks=[
-                {
-                    "type": "rich_text",
-                    "elements": [
-                        {
-                            "type": "rich_text_section",
-                            "elements": [
-                                {
-                                    "type": "text",
-                                    "text": "📥 ", # Unicode emoji
-                                },
-                                {
-                                    "type": "text",
-                                    "text": "Preparing data for download...",
-                                    "style": {
-                                        "bold": True
-                                    }
-                                }
-                            ]
-                        }
-                    ]
-                }
-            ],
-
-        )
-
-        # Re-execute the SQL query to get the data with entitlement filtering
-        filtered_sql = apply_entitlement_filter(sql_query)
-        df = pd.read_sql(filtered_sql, CONN)
+        # Use the entitlement-filtered result fetched when the query first ran,
+        # unless it was capped for display; then fetch every row for the file
+        if cached_query.truncated:
+            print(f"Download: re-running uncapped query for {message_ts}")
+            progress_ts = post_progress(
+                client, channel_id, "⏳ ",
+                f"The result has more than {RESULT_ROW_CAP:,} rows. Fetching every row for your download..."
+            )
+            df = run_query(apply_entitlement_filter(cached_query.sql))
+            post_progress(client, channel_id, "📦 ", f"Fetched {len(df):,} rows. Preparing your file...", ts=progress_ts)
+        else:
+            df = cached_query.df.copy(deep=False)
 
         if DEBUG:
             print(f"DEBUG: DataFrame shape for download: {df.shape}")
@@ -1794,9 +2007,9 @@ def handle_download_data_button_click(ack, body, client):
             )
             return
 
-        # Use BytesIO to create an in-memory file for CSV
-        csv_buffer = io.StringIO()
-        df.to_csv(csv_buffer, index=False)
+        # Write the CSV straight to bytes in one in-memory buffer
+        csv_buffer = io.BytesIO()
+        df.to_csv(csv_buffer, index=False, encoding='utf-8')
         csv_buffer.seek(0)
 
         file_name = f"query_results_{int(time.time())}.csv"
@@ -1807,7 +2020,7 @@ def handle_download_data_button_click(ack, body, client):
         # Capture the response from Slack API for more detailed debugging
         upload_response = client.files_upload_v2(
             channel=channel_id,
-            file=csv_buffer.getvalue().encode('utf-8'), # Encode to bytes for upload
+            file=csv_buffer,
             filename=file_name,
             title="Query Results Data",
 
@@ -1842,7 +2055,7 @@ def handle_download_data_button_click(ack, body, client):
             # Cache the DataFrame for the download message so buttons work
             download_message_ts = download_response['ts']
             global_dataframe_cache[download_message_ts] = df
-            global_sql_cache[download_message_ts] = sql_query
+            cache_put(download_message_ts, cached_query)
             global_original_dataframe_cache[download_message_ts] = global_original_dataframe_cache.get(message_ts, df)
             
             if DEBUG:
@@ -1867,10 +2080,8 @@ def handle_clear_all_filters_button_click(ack, body, client):
     # Get the original message timestamp and channel from the modal's private_metadata
     try:
         private_metadata = body['view']['private_metadata']
-        if "|" in private_metadata:
-            message_ts, channel_id = private_metadata.split("|", 1)
-        else:
-            message_ts = private_metadata
+        message_ts, channel_id, _ = parse_filter_modal_metadata(private_metadata)
+        if channel_id is None:
             channel_id = body['channel']['id']  # fallback
         
         # Get the ORIGINAL unfiltered DataFrame from cache
@@ -1884,7 +2095,7 @@ def handle_clear_all_filters_button_click(ack, body, client):
             return
         
         # Create filtered result message with original (unfiltered) data
-        result_blocks = create_filtered_result_message(df, [], len(df))  # Empty filters list means "no filters applied"
+        result_blocks = create_filtered_result_message(df, [], len(df), is_capped_result(message_ts))  # Empty filters list means "no filters applied"
         
         # Post the original results as a new message in main channel
         response = client.chat_postMessage(
@@ -1896,15 +2107,15 @@ def handle_clear_all_filters_button_click(ack, body, client):
         # Cache the original DataFrame with the new message timestamp
         new_message_ts = response['ts']
         global_dataframe_cache[new_message_ts] = df.copy()
-        global_original_dataframe_cache[new_message_ts] = df.copy()  # Also cache as original
+        global_original_dataframe_cache[new_message_ts] = df  # Same original frame, so filter analysis is reused
         
         # Clear any current filters for the new message (since all filters are cleared)
         global_current_filters_cache[new_message_ts] = {}
         
-        # Also cache the original SQL query so other buttons work
-        original_sql = global_sql_cache.get(message_ts)
-        if original_sql:
-            global_sql_cache[new_message_ts] = original_sql
+        # Also cache the original query so other buttons work
+        cached_query = cache_get(message_ts)
+        if cached_query:
+            cache_put(new_message_ts, cached_query)
         
         if DEBUG:
             print(f"Cleared all filters, cached original DataFrame with new message_ts: {new_message_ts}")
@@ -1925,14 +2136,12 @@ def handle_filter_modal_submission(ack, body, client, view):
     # Get the original message timestamp and channel from the modal's private_metadata
     try:
         private_metadata = view['private_metadata']
-        if "|" in private_metadata:
-            message_ts, channel_id = private_metadata.split("|", 1)
-        else:
-            message_ts = private_metadata
+        message_ts, channel_id, action_fields = parse_filter_modal_metadata(private_metadata)
+        if channel_id is None:
             channel_id = body['user']['id']  # fallback to DM
         
         # Extract filter values from the modal state
-        filter_values = extract_filter_values_from_modal(view['state']['values'])
+        filter_values = extract_filter_values_from_modal(view['state']['values'], action_fields)
         
         # Get the original DataFrame from cache
         df = global_original_dataframe_cache.get(message_ts)
@@ -1948,7 +2157,7 @@ def handle_filter_modal_submission(ack, body, client, view):
         filtered_df, applied_filters = apply_pandas_filters(df, filter_values)
         
         # Create filtered result message
-        result_blocks = create_filtered_result_message(filtered_df, applied_filters, len(df))
+        result_blocks = create_filtered_result_message(filtered_df, applied_filters, len(df), is_capped_result(message_ts))
         
         # Post the filtered results as a new message in main channel
         response = client.chat_postMessage(
@@ -1965,10 +2174,10 @@ def handle_filter_modal_submission(ack, body, client, view):
         # Cache the current filter values for the new message
         global_current_filters_cache[new_message_ts] = filter_values
         
-        # Also cache the original SQL query for the new message
-        original_sql = global_sql_cache.get(message_ts)
-        if original_sql:
-            global_sql_cache[new_message_ts] = original_sql
+        # Also cache the original query for the new message
+        cached_query = cache_get(message_ts)
+        if cached_query:
+            cache_put(new_message_ts, cached_query)
         
         if DEBUG:
             print(f"Applied filters via modal submission, cached filtered DataFrame with new message_ts: {new_message_ts}")
@@ -2027,8 +2236,6 @@ def handle_refine_prompt_modal_submission(ack, body, client, view):
     """
     ack()
     
-    global last_user_prompt_global
-    
     try:
         # Get the original message timestamp and channel from private_metadata
         private_metadata = view.get("private_metadata", "")
@@ -2050,9 +2257,8 @@ def handle_refine_prompt_modal_submission(ack, body, client, view):
             )
             return
         
-        # Update the global prompt variable
-        global last_user_prompt_global
-        last_user_prompt_global = refined_prompt.strip()
+        # Record the refined prompt as this user's latest in the channel
+        remember_prompt(body["user"]["id"], channel_id, refined_prompt.strip())
         
         # Get the current row limit from the original message to preserve it
         current_row_limit = None
@@ -2110,9 +2316,6 @@ def handle_refine_prompt_modal_submission(ack, body, client, view):
         # Instead of copy/paste hack, directly process the refined prompt
         # This gives the user the same experience as if they typed and sent the refined prompt
         
-        # Update the global prompt variable for the background analysis
-        last_user_prompt_global = refined_prompt
-        
         # Create a fake message event to trigger normal processing
         fake_body = {
             "event": {
@@ -2134,23 +2337,14 @@ def handle_refine_prompt_modal_submission(ack, body, client, view):
                 **kwargs
             )
         
-        # Process the refined prompt through the normal message handler
+        # Process the refined prompt the same way as a typed message
         print(f"🔄 Processing refined prompt: {refined_prompt}")
         
-        # Store the preserved row limit globally for the fake message processing
-        global preserved_row_limit_for_refinement
-        preserved_row_limit_for_refinement = current_row_limit
-        
-        # Create a fake ack function
-        def fake_ack():
-            pass
-        
-        handle_message_events(fake_ack, fake_body, fake_say)
-        
-        # Clear the preserved row limit after processing
-        preserved_row_limit_for_refinement = None
+        # Answer on the prompt executor like a typed message; the row limit travels
+        # with this prompt so concurrent refinements never see each other's
+        _prompt_executor.submit(answer_prompt, refined_prompt, fake_body, fake_say, current_row_limit)
         
-        print(f"✅ Refined prompt processed successfully")
+        print(f"✅ Refined prompt queued")
         
     except Exception as e:
         error_info = f"{type(e).__name__} at line {e.__traceback__.tb_lineno} of {__file__}: {e}"
@@ -2180,12 +2374,9 @@ def handle_filter_modal_submission(ack, body, client, view):
             print("Error: No private_metadata found in modal")
             return
         
-        # Parse message_ts and channel_id from private_metadata
-        if "|" in private_metadata:
-            message_ts, channel_id = private_metadata.split("|", 1)
-        else:
-            message_ts = private_metadata
-            channel_id = None  # Fallback - will need to handle this case
+        # Parse message_ts, channel_id and the input field map from private_metadata
+        # (channel_id is None in the fallback case - will need to handle this case)
+        message_ts, channel_id, action_fields = parse_filter_modal_metadata(private_metadata)
         
         # Get the ORIGINAL unfiltered DataFrame from cache
         df = global_original_dataframe_cache.get(message_ts)
@@ -2194,7 +2385,7 @@ def handle_filter_modal_submission(ack, body, client, view):
             return
         
         # Extract filter values from modal
-        filter_values = extract_filter_values_from_modal(view["state"]["values"])
+        filter_values = extract_filter_values_from_modal(view["state"]["values"], action_fields)
         
         if DEBUG:
             print(f"Filter values extracted: {filter_values}")
@@ -2208,7 +2399,7 @@ def handle_filter_modal_submission(ack, body, client, view):
             print(f"Applied filters: {applied_filters}")
         
         # Create filtered result message
-        result_blocks = create_filtered_result_message(filtered_df, applied_filters, len(df))
+        result_blocks = create_filtered_result_message(filtered_df, applied_filters, len(df), is_capped_result(message_ts))
         
         if DEBUG:
             print(f"Filter Modal: Created result blocks, length: {len(result_blocks) if result_blocks else 'None'}")
@@ -2232,16 +2423,17 @@ def handle_filter_modal_submission(ack, body, client, view):
             new_message_ts = response['ts']
             global_dataframe_cache[new_message_ts] = filtered_df
             
-            # Also cache the original SQL query so other buttons (like Show SQL) work
-            original_sql = global_sql_cache.get(message_ts)
-            if original_sql:
-                global_sql_cache[new_message_ts] = original_sql
+            # Also cache the original query so other buttons (like Show SQL) work
+            cached_query = cache_get(message_ts)
+            if cached_query:
+                cache_put(new_message_ts, cached_query)
             
             # IMPORTANT: Propagate the original unfiltered DataFrame reference
             # Always trace back to the very first original DataFrame from SQL
             original_df = global_original_dataframe_cache.get(message_ts)
             if original_df is not None:
-                global_original_dataframe_cache[new_message_ts] = original_df.copy()
+                # Same object, not a copy: the filter-analysis cache is keyed by frame identity
+                global_original_dataframe_cache[new_message_ts] = original_df
                 if DEBUG:
                     print(f"Propagated original DataFrame ({len(original_df)} rows) to new message")
             
@@ -2259,52 +2451,169 @@ def handle_filter_modal_submission(ack, body, client, view):
 
 # --- Initialization and App Start ---
 
-def init():
+# --- Snowflake Connection Pool ---
+SESSION_IDENTITY_QUERY = "SELECT CURRENT_VERSION(), CURRENT_USER(), CURRENT_ROLE(), CURRENT_WAREHOUSE()"
+# (version, user, role, warehouse) per open connection, from SESSION_IDENTITY_QUERY;
+# entries go away with the connection objects
+session_identities = WeakKeyDictionary()
+
+
+class SnowflakeSessionError(Exception):
+    """A new Snowflake session came up without a setting the bot depends on"""
+
+
+# Connection settings shared by every pooled connection, built once from the environment
+SNOWFLAKE_CONNECTION_PARAMS = {
+    "user": CFG.user,
+    "authenticator": "SNOWFLAKE_JWT",
+    "account": CFG.account,
+    "warehouse": CFG.warehouse,
+    "database": CFG.database,
+    "schema": CFG.schema,
+    "role": CFG.role,
+    "host": CFG.host,
+    "paramstyle": "qmark",  # server-side binding for parameterized calls
+    # Pooled connections can sit idle for hours; heartbeat so Snowflake does not
+    # expire the session and force a fresh JWT login on the next question
+    "client_session_keep_alive": True,
+    "client_session_keep_alive_heartbeat_frequency": 900,
+    "network_timeout": 60,
+}
+
+
+def _connect(**overrides):
     """
-    Initializes Snowflake connection and Cortex Chat Agent.
+    Opens a new Snowflake connection with the bot's settings.
+    Keyword arguments override individual entries of SNOWFLAKE_CONNECTION_PARAMS.
     """
-    conn, cortex_app = None, None
+    conn = snowflake.connector.connect(
+        # Parsed and validated once by load_private_key, reused until the key file
+        # changes; the connector signs with the key object without parsing it again
+        private_key=load_private_key(CFG.rsa_private_key_path),
+        **{**SNOWFLAKE_CONNECTION_PARAMS, **overrides}
+    )
+    if not conn.rest.token:
+        raise Exception("Snowflake connection unsuccessful: No token received.")
+
+    # Validate the session settings in one round trip and keep them for logging;
+    # pool health checks only need SELECT 1 after this
+    with conn.cursor() as cur:
+        cur.execute(SESSION_IDENTITY_QUERY)
+        identity = cur.fetchone()
+    version, user, role, warehouse = identity
+    if not warehouse:
+        conn.close()
+        raise SnowflakeSessionError(
+            f"WAREHOUSE={CFG.warehouse} did not become the session warehouse; "
+            f"check that it exists and role {role} can use it."
+        )
+    session_identities[conn] = identity
+    logger.info("Snowflake connection opened (version %s, user %s, role %s, warehouse %s)",
+                version, user, role, warehouse)
+    return conn
 
+
+def _warm_network():
+    """
+    Resolves the Snowflake host and completes one TLS handshake so the first real
+    login does not pay for DNS and a cold TCP/TLS path.
+    """
+    host = CFG.host
     try:
-        conn = snowflake.connector.connect(
-            user=USER,
-            authenticator="SNOWFLAKE_JWT",
-            private_key_file=RSA_PRIVATE_KEY_PATH,
-            account=ACCOUNT,
-            warehouse=WAREHOUSE,
-            database=DATABASE,
-            schema=SCHEMA,
-            role=ROLE,
-            host=HOST
-        )
-        if not conn.rest.token:
-            raise Exception("Snowflake connection unsuccessful: No token received.")
-        print(">>>>>>>>>> Snowflake connection successful.")
-    except Exception as e:
-        print(f"ERROR: Failed to connect to Snowflake: {e}")
-        exit(1) # Exit if Snowflake connection fails
+        socket.getaddrinfo(host, 443)
+        with socket.create_connection((host, 443), timeout=2) as sock:
+            with ssl.create_default_context().wrap_socket(sock, server_hostname=host):
+                pass
+    except OSError as e:
+        logger.warning("Snowflake network warm-up skipped: %s", e)
+
+
+# Each handler checks out its own connection instead of all threads sharing one.
+# Every prompt worker and Socket Mode dispatch thread can hold a connection at
+# once, so the pool is sized for both; connections are still opened on demand and
+# LIFO reuse lets the extra ones idle. A caller that somehow still finds the pool
+# exhausted fails after CONNECTION_ACQUIRE_TIMEOUT seconds instead of hanging.
+CONNECTION_POOL_SIZE = PROMPT_WORKERS + SOCKET_MODE_CONCURRENCY
+CONNECTION_ACQUIRE_TIMEOUT = 120
+CONNECTION_POOL_MIN_SIZE = 2  # opened in the background at startup
+snowflake_pool = SnowflakeConnectionPool(
+    _connect, max_size=CONNECTION_POOL_SIZE, acquire_timeout=CONNECTION_ACQUIRE_TIMEOUT
+)
+snowflake_session = snowflake_pool.session
 
+
+def _warm_up_snowflake():
+    """
+    Runs on a background thread at startup: warms the network path, then opens
+    CONNECTION_POOL_MIN_SIZE pooled connections so the first question does not
+    pay for the login. Failures are logged; handlers will retry on demand.
+    """
+    _warm_network()
     try:
-        cortex_app = cortex_chat.CortexChat(
-            AGENT_ENDPOINT,
-            SEARCH_SERVICE,
-            SEMANTIC_MODEL,
-            MODEL,
-            ACCOUNT,
-            USER,
-            RSA_PRIVATE_KEY_PATH
-        )
-        print(">>>>>>>>>> Cortex Chat Agent initialized.")
+        snowflake_pool.prewarm(CONNECTION_POOL_MIN_SIZE)
     except Exception as e:
-        print(f"ERROR: Failed to initialize Cortex Chat Agent: {e}")
-        exit(1) # Exit if Cortex Chat Agent initialization fails
+        logger.warning("Could not prewarm Snowflake connections: %s", e)
+
+
+_cortex_app = None
+_cortex_app_lock = Lock()
+
+
+def get_cortex_app():
+    """
+    Returns the Cortex Chat Agent, creating it on first use so startup does not
+    wait on key loading and JWT signing before Socket Mode connects.
+    """
+    global _cortex_app
+    if _cortex_app is None:
+        with _cortex_app_lock:
+            if _cortex_app is None:
+                _cortex_app = cortex_chat.CortexChat(
+                    CFG.agent_endpoint,
+                    CFG.search_service,
+                    CFG.semantic_model,
+                    CFG.model,
+                    CFG.account,
+                    CFG.user,
+                    CFG.rsa_private_key_path
+                )
+                logger.info("Cortex Chat Agent initialized")
+    return _cortex_app
+
+# The bot's own module loggers; everything else (the Snowflake connector, Slack SDK,
+# generate_jwt) stays at WARNING so query text and JWT payloads are never logged
+APP_LOGGERS = ("__main__", "charter", "connection_pool", "data_filter_modal", "dataframe_utils")
+QUIET_LOGGERS = ("snowflake.connector", "generate_jwt")
+
+
+def configure_logging(level=logging.INFO):
+    """
+    Routes log records through a queue to a background listener thread, so
+    handler threads never block on writes to stdout when it is a slow pipe.
+    Only APP_LOGGERS log below WARNING. Returns the started QueueListener.
+    """
+    log_queue = SimpleQueue()
+    listener = QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+        handlers=[QueueHandler(log_queue)],
+    )
+    for name in APP_LOGGERS:
+        logging.getLogger(name).setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    listener.start()
+    return listener
 
-    print(">>>>>>>>>> Init complete")
-    return conn, cortex_app
 
 if __name__ == "__main__":
-    CONN, CORTEX_APP = init()
-    Root = Root(CONN) # Assuming Root is used elsewhere or for Snowpark Session
-    print("Starting SocketModeHandler...")
-    SocketModeHandler(app, SLACK_APP_TOKEN).start()
-    SocketModeHandler(app, SLACK_APP_TOKEN).start()
\ No newline at end of file
+    log_listener = configure_logging(logging.DEBUG if DEBUG else logging.INFO)
+    # Open the first Snowflake connections in the background so Socket Mode starts
+    # right away; the Cortex agent is created on the first message
+    Thread(target=_warm_up_snowflake, name="snowflake-warmup", daemon=True).start()
+    logger.info("Starting SocketModeHandler...")
+    try:
+        SocketModeHandler(app, CFG.slack_app_token, concurrency=SOCKET_MODE_CONCURRENCY).start()
+    finally:
+        log_listener.stop()
\ No newline at end of file
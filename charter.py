@@ -1,47 +1,115 @@
-import plotly.express as px
 import pandas as pd
+import numpy as np
 import json
 import ast
 import os
+import logging
+from functools import lru_cache
+from types import MappingProxyType
 from snowflake.snowpark import Session
 
-# Dictionary mapping string keys to corresponding Plotly Express functions.
-PX_FUNCTIONS = {
-    "scatter": px.scatter,
-    "line": px.line,
-    "area": px.area,
-    "bar": px.bar,
-    "histogram": px.histogram,
-    "violin": px.violin,
-    "box": px.box,
-    "strip": px.strip,
-    "funnel": px.funnel,
-    "funnel_area": px.funnel_area,
-    "scatter_3d": px.scatter_3d,
-    "line_3d": px.line_3d,
-    "scatter_ternary": px.scatter_ternary,
-    "line_ternary": px.line_ternary,
-    "scatter_mapbox": px.scatter_mapbox,
-    "line_mapbox": px.line_mapbox,
-    "density_mapbox": px.density_mapbox,
-    "choropleth_mapbox": px.choropleth_mapbox,
-    "scatter_geo": px.scatter_geo,
-    "line_geo": px.line_geo,
-    "choropleth": px.choropleth,
-    "scatter_polar": px.scatter_polar,
-    "line_polar": px.line_polar,
-    "bar_polar": px.bar_polar,
-    "scatter_matrix": px.scatter_matrix,
-    "imshow": px.imshow,
-    "density_contour": px.density_contour,
-    "density_heatmap": px.density_heatmap,
-    "pie": px.pie,
-    "treemap": px.treemap,
-    "sunburst": px.sunburst,
-    "parallel_coordinates": px.parallel_coordinates,
-    "parallel_categories": px.parallel_categories,
-    "timeline": px.timeline
-}
+logger = logging.getLogger(__name__)
+
+# Name of the Plotly template holding the static styling shared by all charts.
+SALES_TEMPLATE_NAME = "sales_base"
+
+@lru_cache(maxsize=None)
+def _px_functions() -> MappingProxyType:
+    """
+    Returns a read-only mapping of string keys to Plotly Express functions.
+
+    Plotly Express is imported on first use rather than at module import, since
+    loading it builds Plotly's schema registry and not every caller plots.
+    """
+    import plotly.express as px
+
+    return MappingProxyType({
+        "scatter": px.scatter,
+        "line": px.line,
+        "area": px.area,
+        "bar": px.bar,
+        "histogram": px.histogram,
+        "violin": px.violin,
+        "box": px.box,
+        "strip": px.strip,
+        "funnel": px.funnel,
+        "funnel_area": px.funnel_area,
+        "scatter_3d": px.scatter_3d,
+        "line_3d": px.line_3d,
+        "scatter_ternary": px.scatter_ternary,
+        "line_ternary": px.line_ternary,
+        "scatter_mapbox": px.scatter_mapbox,
+        "line_mapbox": px.line_mapbox,
+        "density_mapbox": px.density_mapbox,
+        "choropleth_mapbox": px.choropleth_mapbox,
+        "scatter_geo": px.scatter_geo,
+        "line_geo": px.line_geo,
+        "choropleth": px.choropleth,
+        "scatter_polar": px.scatter_polar,
+        "line_polar": px.line_polar,
+        "bar_polar": px.bar_polar,
+        "scatter_matrix": px.scatter_matrix,
+        "imshow": px.imshow,
+        "density_contour": px.density_contour,
+        "density_heatmap": px.density_heatmap,
+        "pie": px.pie,
+        "treemap": px.treemap,
+        "sunburst": px.sunburst,
+        "parallel_coordinates": px.parallel_coordinates,
+        "parallel_categories": px.parallel_categories,
+        "timeline": px.timeline
+    })
+
+
+@lru_cache(maxsize=None)
+def _sales_template() -> str:
+    """
+    Registers the shared static chart styling as a Plotly template and returns
+    the template spec to apply to figures.
+
+    The styling is built once and shared by every chart instead of being
+    rebuilt per figure. It is layered on top of the current default template
+    so Plotly's colorway and other defaults are kept.
+    """
+    import plotly.graph_objects as go
+    import plotly.io as pio
+
+    grid = dict(showgrid=True, gridwidth=1, gridcolor='lightgray')  # Grid lines for better readability
+    pio.templates[SALES_TEMPLATE_NAME] = go.layout.Template(
+        layout=dict(
+            plot_bgcolor='white',  # Clean white background
+            paper_bgcolor='white',
+            font=dict(size=12),  # Readable font size
+            xaxis=grid,  # Template axis settings apply to every subplot axis
+            yaxis=grid
+        )
+    )
+    return f"{pio.templates.default}+{SALES_TEMPLATE_NAME}"
+
+
+def _fmt_currency(values) -> list:
+    """
+    Formats numeric values as abbreviated currency labels (e.g. $1.2M, $450K).
+
+    The magnitude bucket for every value is picked with vectorized comparisons,
+    so this is used directly on the array of axis tick values.
+
+    Args:
+        values (array-like): The numeric values to format.
+
+    Returns:
+        list of str: One formatted label per value.
+    """
+    values = np.asarray(values, dtype=float)
+    abs_values = np.abs(values)
+    buckets = [abs_values >= 1_000_000_000, abs_values >= 1_000_000, abs_values >= 1_000]
+    divisors = np.select(buckets, [1_000_000_000, 1_000_000, 1_000], default=1)
+    suffixes = np.select(buckets, ['B', 'M', 'K'], default='')
+    return [
+        f'${value:.1f}{suffix}' if suffix in ('B', 'M') else f'${value:.0f}{suffix}'
+        for value, suffix in zip(values / divisors, suffixes)
+    ]
+
 
 def _get_kwargs(function_arguments) -> dict:
     """
@@ -166,7 +234,7 @@ def _get_kwargs(function_arguments) -> dict:
     return kwargs
 
 
-def _plot_with_px(name: str, data_frame, **kwargs):
+def _plot_with_px(name: str, data_frame, *, original_prompt=None, original_size=None, was_sampled=False, **kwargs):
     """
     Generates a Plotly Express chart dynamically based on a string key.
 
@@ -174,6 +242,9 @@ def _plot_with_px(name: str, data_frame, **kwargs):
         name (str): The string key representing the desired Plotly Express function.
                     If prefixed with 'px.', it will be stripped.
         data_frame (pandas.DataFrame): The dataset to visualize.
+        original_prompt (str, optional): The user's question, used to enhance the chart title.
+        original_size (int, optional): Row count before sampling. Defaults to len(data_frame).
+        was_sampled (bool): Whether data_frame is a sample of a larger dataset.
         **kwargs: Additional keyword arguments to be passed to the selected Plotly Express function.
 
     Returns:
@@ -185,7 +256,7 @@ def _plot_with_px(name: str, data_frame, **kwargs):
     if name.startswith('px.'):
         name = name[3:]  # Remove 'px.' prefix if present
 
-    func = PX_FUNCTIONS.get(name)  # Retrieve the corresponding Plotly function
+    func = _px_functions().get(name)  # Retrieve the corresponding Plotly function
     if func is None:
         raise ValueError(f"No Plotly Express function found for key '{name}'")
 
@@ -195,7 +266,7 @@ def _plot_with_px(name: str, data_frame, **kwargs):
     # Handle datetime columns
     if 'x' in kwargs:
         x_col = kwargs['x']
-        if x_col in processed_data.columns and processed_data[x_col].dtype.name.startswith('datetime'):
+        if x_col in processed_data.columns and pd.api.types.is_datetime64_any_dtype(processed_data[x_col]):
             # Convert to string format
             processed_data[x_col] = processed_data[x_col].dt.strftime('%Y-%m')
             print(f"Converted datetime column '{x_col}' to string format for plotting")
@@ -204,7 +275,7 @@ def _plot_with_px(name: str, data_frame, **kwargs):
     for col in processed_data.columns:
         try:
             # Check if column has mixed types that could cause dtype promotion issues
-            if processed_data[col].dtype == 'object':
+            if pd.api.types.is_object_dtype(processed_data[col]):
                 # Try to identify if it's actually numeric data stored as object
                 temp_numeric = pd.to_numeric(processed_data[col], errors='coerce')
                 if temp_numeric.notna().sum() > 0 and temp_numeric.notna().sum() / len(temp_numeric) > 0.8:
@@ -228,15 +299,15 @@ def _plot_with_px(name: str, data_frame, **kwargs):
     except Exception as plot_error:
         print(f"⚠️ Plotly function failed: {str(plot_error)}")
         # Return fallback chart instead of crashing
-        return _create_fallback_chart(data_frame, getattr(_plot_with_px, '_current_prompt', 'Data Analysis'))
+        return _create_fallback_chart(data_frame, original_prompt or 'Data Analysis')
     
     # Enhance chart with dataset information
     data_description = f"Dataset: {processed_data.shape[0]} records across {processed_data.shape[1]} columns"
     
     # Get context information
-    prompt_info = getattr(_plot_with_px, '_current_prompt', None)
-    was_sampled = getattr(_plot_with_px, '_was_sampled', False)
-    original_size = getattr(_plot_with_px, '_original_size', len(data_frame))
+    prompt_info = original_prompt
+    if original_size is None:
+        original_size = len(data_frame)
     
     # Include sampling information
     final_data_description = data_description
@@ -252,120 +323,91 @@ def _plot_with_px(name: str, data_frame, **kwargs):
             title_parts.append(f"<i>Question: {short_prompt}</i>")
         title_parts.append(f"<sub>{final_data_description}</sub>")
         enhanced_title = "<br>".join(title_parts)
-        fig.update_layout(title=enhanced_title)
     else:
         base_title = prompt_info[:50] + "..." if prompt_info and len(prompt_info) > 50 else (prompt_info if prompt_info else "Data Analysis")
         enhanced_title = f"{base_title}<br><sub>{final_data_description}</sub>"
-        fig.update_layout(title=enhanced_title)
     
-    # Debug: Print actual data values before chart generation
-    print("=== CHART DEBUG INFO ===")
-    print(f"DataFrame shape: {data_frame.shape}")
-    print(f"DataFrame dtypes: {data_frame.dtypes.to_dict()}")
-    if 'x' in kwargs:
-        x_col = kwargs['x']
-        if x_col in data_frame.columns:
-            print(f"X-axis column '{x_col}' sample values:")
-            print(data_frame[x_col].head().tolist())
-            print(f"X-axis column '{x_col}' data type: {data_frame[x_col].dtype}")
-            print(f"X-axis column '{x_col}' min/max: {data_frame[x_col].min()} / {data_frame[x_col].max()}")
-    if 'y' in kwargs:
-        y_col = kwargs['y']
-        if y_col in data_frame.columns:
-            print(f"Y-axis column '{y_col}' sample values:")
-            print(data_frame[y_col].head().tolist())
-            print(f"Y-axis column '{y_col}' data type: {data_frame[y_col].dtype}")
-            print(f"Y-axis column '{y_col}' min/max: {data_frame[y_col].min()} / {data_frame[y_col].max()}")
-    print("========================")
+    # Debug: Log actual data values before chart generation. The level check
+    # skips the dtype/min/max scans entirely unless DEBUG logging is enabled.
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("=== CHART DEBUG INFO ===")
+        logger.debug("DataFrame shape: %s", data_frame.shape)
+        logger.debug("DataFrame dtypes: %s", data_frame.dtypes.to_dict())
+        for axis in ('x', 'y'):
+            col = kwargs.get(axis)
+            if col in data_frame.columns:
+                logger.debug("%s-axis column '%s' sample values: %s", axis.upper(), col, data_frame[col].head().tolist())
+                logger.debug("%s-axis column '%s' data type: %s", axis.upper(), col, data_frame[col].dtype)
+                logger.debug("%s-axis column '%s' min/max: %s / %s", axis.upper(), col, data_frame[col].min(), data_frame[col].max())
+        logger.debug("========================")
+    
+    # Accumulate every layout change and apply them with a single update_layout
+    # call, so Plotly validates the layout tree once per figure.
+    xaxis_layout = {}
+    yaxis_layout = {}
     
     # Format large numbers to avoid scientific notation
-    # Helper function for Y-axis currency formatting (same as used for labels)
-    def format_currency_axis(value):
-        if abs(value) >= 1_000_000_000:
-            return f'${value/1_000_000_000:.1f}B'
-        elif abs(value) >= 1_000_000:
-            return f'${value/1_000_000:.1f}M'
-        elif abs(value) >= 1_000:
-            return f'${value/1_000:.0f}K'
-        else:
-            return f'${value:.0f}'
-    
     # Apply custom abbreviated currency formatting to Y-axis ticks
     if 'y' in kwargs:
         y_col = kwargs['y']
         if y_col in processed_data.columns:
             # Get the range of Y values to determine appropriate tick values
-            y_min = processed_data[y_col].min()
-            y_max = processed_data[y_col].max()
+            y_min, y_max = processed_data[y_col].agg(['min', 'max'])
             
             # Create custom tick values and labels
-            import numpy as np
             tick_count = 6  # Number of ticks on Y-axis
             tick_values = np.linspace(y_min, y_max, tick_count)
-            tick_labels = [format_currency_axis(val) for val in tick_values]
+            tick_labels = _fmt_currency(tick_values)
             
-            fig.update_layout(
-                yaxis=dict(
-                    tickmode='array',
-                    tickvals=tick_values,
-                    ticktext=tick_labels,
-                    hoverformat=',.2f',
-                    exponentformat='none'
-                )
+            yaxis_layout.update(
+                tickmode='array',
+                tickvals=tick_values,
+                ticktext=tick_labels,
+                hoverformat=',.2f',
+                exponentformat='none'
             )
     else:
         # Fallback formatting for non-currency data
-        fig.update_layout(
-            yaxis=dict(
-                tickformat=',.0f',  # Format numbers with commas, no decimals for y-axis
-                hoverformat=',.2f',  # Format hover text with commas and 2 decimals
-                exponentformat='none'  # Disable scientific notation
-            )
+        yaxis_layout.update(
+            tickformat=',.0f',  # Format numbers with commas, no decimals for y-axis
+            hoverformat=',.2f',  # Format hover text with commas and 2 decimals
+            exponentformat='none'  # Disable scientific notation
         )
     
     # Handle X-axis formatting - check if it's numeric (datetime is now converted to strings)
     if 'x' in kwargs:
         x_col = kwargs['x']
-        if x_col in data_frame.columns and data_frame[x_col].dtype in ['int64', 'float64']:
+        if x_col in data_frame.columns and pd.api.types.is_numeric_dtype(data_frame[x_col]):
             # For numeric columns, use comma formatting
-            fig.update_layout(
-                xaxis=dict(
-                    tickformat=',.0f',  # Format x-axis numbers with commas
-                    exponentformat='none'  # Disable scientific notation on x-axis too
-                )
+            xaxis_layout.update(
+                tickformat=',.0f',  # Format x-axis numbers with commas
+                exponentformat='none'  # Disable scientific notation on x-axis too
             )
     
     # Enhanced hover template for better user experience
-    if 'y' in kwargs:
-        y_col = kwargs['y']
-        if y_col in processed_data.columns:
-            # Update traces with enhanced hover information only
-            trace_updates = {
-                'hovertemplate': f'<b>%{{x}}</b><br>{y_col}: %{{y:,.0f}}<br><extra></extra>'  # Enhanced hover with column name
-            }
-            
-            # Apply the updates to all traces
-            fig.update_traces(**trace_updates)
+    y_col = kwargs.get('y')
+    if y_col is not None and y_col in processed_data.columns:
+        # Enhanced hover with column name
+        hovertemplate = f'<b>%{{x}}</b><br>{y_col}: %{{y:,.0f}}<br><extra></extra>'
+    else:
+        # Fallback hover formatting for traces without specific formatting
+        hovertemplate = '%{y:,.0f}<extra></extra>'  # Custom hover format to avoid scientific notation
     
-    # Fallback hover formatting for traces without specific formatting
-    fig.update_traces(
-        hovertemplate='%{y:,.0f}<extra></extra>'  # Custom hover format to avoid scientific notation
-    )
+    # Apply the hover template to all traces
+    fig.update_traces(hovertemplate=hovertemplate)
     
-    # Enhance overall chart appearance
+    # Enhance overall chart appearance; static styling comes from the shared template.
+    # Margin stays explicit because Plotly Express sets its own margin on the figure.
     fig.update_layout(
+        template=_sales_template(),
+        title=enhanced_title,
+        xaxis=xaxis_layout,
+        yaxis=yaxis_layout,
         showlegend=True,  # Show legend if multiple series
-        plot_bgcolor='white',  # Clean white background
-        paper_bgcolor='white',
-        font=dict(size=12),  # Readable font size
         margin=dict(t=100, b=80, l=80, r=80),  # Better margins for labels
         height=500  # Consistent height for better readability
     )
     
-    # Add grid lines for better readability
-    fig.update_xaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
-    fig.update_yaxes(showgrid=True, gridwidth=1, gridcolor='lightgray')
-    
     try:
         # Test if the figure can be rendered by converting to JSON
         # This catches most rendering issues before they hit Kaleido
@@ -376,9 +418,6 @@ def _plot_with_px(name: str, data_frame, **kwargs):
         # Return a simple fallback chart
         import plotly.graph_objects as go
         fallback_fig = go.Figure()
-        # Get sampling info if available
-        was_sampled = getattr(_plot_with_px, '_was_sampled', False)
-        original_size = getattr(_plot_with_px, '_original_size', len(data_frame))
         
         if was_sampled:
             size_text = f"Dataset: {original_size:,} rows (sampled to {len(data_frame):,})"
@@ -480,6 +519,27 @@ def _create_fallback_chart(data: pd.DataFrame, original_prompt: str):
     return fig
 
 
+def _sample_to_pandas(data, max_rows: int):
+    """
+    Converts a non-pandas DataFrame (Polars, PyArrow, ...) to pandas via Narwhals,
+    sampling it down to max_rows first so only the plotted rows are materialized.
+
+    Args:
+        data: Any eager DataFrame supported by Narwhals.
+        max_rows (int): The maximum number of rows to keep.
+
+    Returns:
+        tuple: (pandas.DataFrame, int) - the converted frame and the original row count.
+    """
+    import narwhals as nw
+
+    frame = nw.from_native(data, eager_only=True)
+    original_size = len(frame)
+    if original_size > max_rows:
+        frame = frame.sample(n=max_rows, seed=42)
+    return frame.to_pandas(), original_size
+
+
 def ai_plot(session: Session, original_prompt: str, data: pd.DataFrame):
     """
     Generates a Plotly Express visualization based on a dataset and user query using an AI model.
@@ -489,7 +549,9 @@ def ai_plot(session: Session, original_prompt: str, data: pd.DataFrame):
     
     Args:
         original_prompt (str): The user's query or question regarding the dataset.
-        data (pd.DataFrame): The dataset to visualize.
+        data (pd.DataFrame): The dataset to visualize. Other eager DataFrames supported
+            by Narwhals (e.g. Polars, PyArrow tables) are sampled natively and only the
+            sampled rows are converted to pandas.
 
     Returns:
         plotly.graph_objects.Figure: A Plotly figure generated dynamically based on the AI's recommendation.
@@ -500,7 +562,11 @@ def ai_plot(session: Session, original_prompt: str, data: pd.DataFrame):
     
     # Sample large datasets to prevent rendering issues
     MAX_VISUALIZATION_ROWS = 5000
-    original_size = len(data)
+    
+    if not isinstance(data, pd.DataFrame):
+        data, original_size = _sample_to_pandas(data, MAX_VISUALIZATION_ROWS)
+    else:
+        original_size = len(data)
     
     if len(data) > MAX_VISUALIZATION_ROWS:
         print(f"Your dataset has over 5000 rows, which is too large for visualization.")
@@ -524,11 +590,13 @@ def ai_plot(session: Session, original_prompt: str, data: pd.DataFrame):
     '''
     
     # User-specific prompt, including the original question and a preview of the dataset.
+    # CSV is denser than the padded DataFrame repr, so the sample costs fewer tokens.
+    sample = data.head(100).to_csv(index=False)  # Sending the first 100 rows as a sample
     user_prompt = f"""
     Question: {original_prompt}
     
-    Data Preview:
-    {data.iloc[:100]}  # Sending the first 100 rows as a sample
+    Data Preview (CSV):
+    {sample}
     """
     
     # Defines the expected AI response format as JSON, ensuring a structured response.
@@ -581,6 +649,9 @@ def ai_plot(session: Session, original_prompt: str, data: pd.DataFrame):
     
     model = os.getenv('MODEL', 'claude-4-sonnet')  # Use model from environment variable
     
+    # Serialize options as JSON; a Python dict repr is not valid JSON (quotes, True/False).
+    options_json = json.dumps(options)
+    
     # SQL query to invoke the AI model via Snowflake Cortex.
     query = f"""
     SELECT snowflake.cortex.complete(
@@ -595,7 +666,7 @@ def ai_plot(session: Session, original_prompt: str, data: pd.DataFrame):
                 'content': $${user_prompt}$$
             }}
         ],
-        {options}
+        TO_OBJECT(PARSE_JSON($${options_json}$$))
     )
     """
 
@@ -631,29 +702,20 @@ def ai_plot(session: Session, original_prompt: str, data: pd.DataFrame):
     print('Plotting with Kwargs:')
     print(json.dumps(kwargs, indent=4))
 
-    # Pass the original prompt and sampling info to the plotting function for title enhancement
-    _plot_with_px._current_prompt = original_prompt
-    _plot_with_px._original_size = original_size
-    _plot_with_px._was_sampled = len(data) < original_size
-    
     try:
-        # Generate and return the visualization.
-        result = _plot_with_px(function_name, data, **kwargs)
-        
-        # Clean up the references
-        for attr in ['_current_prompt', '_original_size', '_was_sampled']:
-            if hasattr(_plot_with_px, attr):
-                delattr(_plot_with_px, attr)
-        
-        return result
+        # Generate and return the visualization, passing the original prompt and
+        # sampling info to the plotting function for title enhancement.
+        return _plot_with_px(
+            function_name,
+            data,
+            original_prompt=original_prompt,
+            original_size=original_size,
+            was_sampled=len(data) < original_size,
+            **kwargs
+        )
     
     except Exception as ai_plot_error:
         print(f"⚠️ AI plot generation failed: {str(ai_plot_error)}")
         
-        # Clean up the references even in error case
-        for attr in ['_current_prompt', '_original_size', '_was_sampled']:
-            if hasattr(_plot_with_px, attr):
-                delattr(_plot_with_px, attr)
-        
         # Return fallback chart
         return _create_fallback_chart(data, original_prompt)
\ No newline at end of file
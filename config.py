@@ -0,0 +1,58 @@
+"""
+Bot configuration, read from the environment once at startup.
+"""
+
+import os
+from dataclasses import dataclass
+from types import MappingProxyType
+
+
+@dataclass(frozen=True)
+class SFConfig:
+    """Required settings for Snowflake, the Cortex agent and Slack (see fill-in-the-env.txt)"""
+    account: str
+    host: str
+    user: str
+    database: str
+    schema: str
+    role: str
+    warehouse: str
+    rsa_private_key_path: str
+    agent_endpoint: str
+    semantic_model: str
+    search_service: str
+    model: str
+    slack_app_token: str
+    slack_bot_token: str
+
+    # Field name -> environment variable (read-only, shared by all instances)
+    ENV_VARS = MappingProxyType({
+        "account": "ACCOUNT",
+        "host": "HOST",
+        "user": "DEMO_USER",
+        "database": "DEMO_DATABASE",
+        "schema": "DEMO_SCHEMA",
+        "role": "DEMO_USER_ROLE",
+        "warehouse": "WAREHOUSE",
+        "rsa_private_key_path": "RSA_PRIVATE_KEY_PATH",
+        "agent_endpoint": "AGENT_ENDPOINT",
+        "semantic_model": "SEMANTIC_MODEL",
+        "search_service": "SEARCH_SERVICE",
+        "model": "MODEL",
+        "slack_app_token": "SLACK_APP_TOKEN",
+        "slack_bot_token": "SLACK_BOT_TOKEN",
+    })
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds the config from environment variables.
+        Raises KeyError naming the first required variable that is unset or empty.
+        """
+        values = {}
+        for field_name, env_var in cls.ENV_VARS.items():
+            value = os.getenv(env_var)
+            if not value:
+                raise KeyError(env_var)
+            values[field_name] = value
+        return cls(**values)
@@ -0,0 +1,115 @@
+"""
+Process-wide pool of Snowflake connections shared by the Slack handlers.
+
+Opening a connection costs a JWT login plus a TLS handshake, so connections are
+checked out for the duration of a with block and returned for reuse.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from threading import Condition
+
+logger = logging.getLogger(__name__)
+
+
+class SnowflakeConnectionPool:
+    """
+    A LIFO pool of at most max_size connections opened lazily through connect().
+    Connections idle for longer than health_check_after seconds are pinged with
+    SELECT 1 before reuse and replaced if the ping fails. Callers wait at most
+    acquire_timeout seconds for a connection or a free slot before TimeoutError.
+    """
+
+    def __init__(self, connect, max_size=10, health_check_after=60, acquire_timeout=120):
+        self._connect = connect
+        self.max_size = max_size
+        self.health_check_after = health_check_after
+        self.acquire_timeout = acquire_timeout
+        self._idle = []  # stack of (connection, time it was returned)
+        # Signalled whenever a connection is returned or a slot is freed
+        self._available = Condition()
+        self._opened = 0
+
+    def _release_slot(self):
+        with self._available:
+            self._opened -= 1
+            self._available.notify()
+
+    def _open(self):
+        """Opens a connection in an already reserved slot, freeing the slot on failure"""
+        try:
+            return self._connect()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logger.debug("Ignoring error closing Snowflake connection: %s", e)
+
+    def _is_connection_alive(self, conn):
+        if conn.is_closed():
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except Exception as e:
+            logger.warning("Pooled Snowflake connection failed health check: %s", e)
+            return False
+
+    def _acquire(self):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._available:
+            while not self._idle and self._opened >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"No Snowflake connection became available within {self.acquire_timeout}s "
+                        f"({self.max_size} connections in use)"
+                    )
+                self._available.wait(remaining)
+            if self._idle:
+                conn, returned_at = self._idle.pop()
+            else:
+                self._opened += 1
+                conn = None
+
+        if conn is None:
+            return self._open()
+        if conn.is_closed() or (time.monotonic() - returned_at > self.health_check_after
+                                and not self._is_connection_alive(conn)):
+            # Keep the slot and replace the dead connection in it
+            self._close(conn)
+            return self._open()
+        return conn
+
+    def _release(self, conn):
+        with self._available:
+            self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def prewarm(self, min_size):
+        """Open connections until at least min_size exist, so first requests skip the login"""
+        while True:
+            with self._available:
+                if self._opened >= min(min_size, self.max_size):
+                    return
+                self._opened += 1
+            self._release(self._open())
+
+    @contextmanager
+    def session(self):
+        """
+        Checks a connection out of the pool for the duration of a with block,
+        opening a new one if none is idle and the pool is not full, otherwise
+        waiting up to acquire_timeout seconds for one to be returned.
+        """
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
@@ -1,8 +1,13 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
 import generate_jwt
+from datetime import timedelta
 from generate_jwt import JWTGenerator
 
+# Renew the JWT shortly before it expires rather than on a 401
+JWT_RENEWAL_DELAY = JWTGenerator.LIFETIME - timedelta(seconds=30)
+
 DEBUG = True
 
 class CortexChat:
@@ -22,10 +27,17 @@ class CortexChat:
         self.account = account
         self.user = user
         self.private_key_path = private_key_path
-        self.jwt = JWTGenerator(self.account, self.user, self.private_key_path).get_token()
+        # Keep-alive session so repeated agent calls reuse TLS connections;
+        # sized for the bot's concurrent prompt workers
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        self.jwt_generator = JWTGenerator(self.account, self.user, self.private_key_path,
+                                          renewal_delay=JWT_RENEWAL_DELAY)
+        self.jwt = self.jwt_generator.get_token()
 
     def _retrieve_response(self, query: str, limit=1) -> dict[str, any]:
         url = self.agent_url
+        self.jwt = self.jwt_generator.get_token()  # cached until just before it expires
         headers = {
             'X-Snowflake-Authorization-Token-Type': 'KEYPAIR_JWT',
             'Content-Type': 'application/json',
@@ -73,16 +85,17 @@ class CortexChat:
                 }
             },
         }
-        response = requests.post(url, headers=headers, json=data)
+        response = self.session.post(url, headers=headers, json=data)
 
         if response.status_code == 401:  # Unauthorized - likely expired JWT
             print("JWT has expired. Generating new JWT...")
             # Generate new token
-            self.jwt = JWTGenerator(self.account, self.user, self.private_key_path).get_token()
+            self.jwt_generator.expire_token()
+            self.jwt = self.jwt_generator.get_token()
             # Retry the request with the new token
             headers["Authorization"] = f"Bearer {self.jwt}"
             print("New JWT generated. Sending new request to Cortex Agents API. Please wait...")
-            response = requests.post(url, headers=headers, json=data)
+            response = self.session.post(url, headers=headers, json=data)
 
         if DEBUG:
             print(response.text)
@@ -6,14 +6,41 @@ Users can click "Filter Query" to open a modal with various filter options,
 then apply filters using pandas operations for fast in-memory filtering.
 """
 
+import re
+import json
+import logging
+import threading
+import weakref
+import numpy as np
 import pandas as pd
+from collections import Counter, OrderedDict
 from datetime import datetime, timedelta
 
+logger = logging.getLogger(__name__)
 
 # Constants for filter modal
 FILTER_DATA_BUTTON_ACTION_ID = "filter_data_button"
 FILTER_MODAL_CALLBACK_ID = "data_filter_modal"
 
+# Shapes pd.to_datetime can parse, used to pre-screen object columns before date
+# inference: 2024-01-15, 2024-01, 2024/1/5, 01/15/2024, 15.01.24, 15 Jan 2024,
+# Jan 2024, January 15, 2024Q1, 2024-Q1, a bare year (2024) or 20240115
+_DATE_LIKE_RE = re.compile(
+    r'^\s*('
+    r'\d{4}[-/.]\d{1,2}'
+    r'|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}'
+    r'|\d{1,2}\s+[A-Za-z]{3,9}'
+    r'|[A-Za-z]{3,9}\.?\s+\d{1,4}'
+    r'|\d{4}-?[Qq][1-4]'
+    r'|\d{4}\s*$'
+    r'|\d{8}\s*$'
+    r')'
+)
+
+# Applied-filter descriptions ("COL in [...]", "COL >= value") parsed for the result message
+_IN_FILTER_RE = re.compile(r"(\w+) in \[(.+)\]")
+_COMPARISON_FILTER_RE = re.compile(r"(\w+) ([><=]+) (.+)")
+
 
 def get_filter_data_button_element():
     """Create the Filter Query button element"""
@@ -39,40 +66,49 @@ def analyze_dataframe_for_filters(df):
         "has_region_data": False
     }
     
-    # Check for date columns
-    for col in df.columns:
-        if 'DATE' in col.upper() or 'PERIOD' in col.upper():
+    # Analysis limits based on data characteristics, not column names
+    max_analysis_limit = 200  # Default limit for analysis phase
+    
+    # Classify every column in a single pass over the dtypes vector, passing the
+    # dtype objects (not Series) to the pandas type checks
+    for col, dtype in zip(df.columns, df.dtypes):
+        col_upper = col.upper()
+        
+        # Check for date columns
+        if 'DATE' in col_upper or 'PERIOD' in col_upper:
             # Check if it's already a datetime type
-            if pd.api.types.is_datetime64_any_dtype(df[col]):
+            if pd.api.types.is_datetime64_any_dtype(dtype):
                 filters_available["date_columns"].append(col)
-            elif df[col].dtype == 'object':
-                # Try to convert to datetime to verify it's a date column
-                try:
-                    pd.to_datetime(df[col].head(), errors='raise')
-                    filters_available["date_columns"].append(col)
-                except:
-                    pass
-    
-    # Check for categorical columns with reasonable number of unique values
-    for col in df.columns:
-        if df[col].dtype == 'object' and col not in filters_available["date_columns"]:
-            unique_vals = df[col].nunique()
-            print(f"DEBUG: Column '{col}' analysis: dtype='{df[col].dtype}', unique_vals={unique_vals}")
-            
-            # Analysis limits based on data characteristics, not column names
-            max_analysis_limit = 200  # Default limit for analysis phase
+                continue
+            elif dtype == 'object':
+                # Cheap pre-filter on a few non-null samples before paying for
+                # pandas' datetime inference
+                samples = df[col].dropna().head(3).astype(str)
+                if any(_DATE_LIKE_RE.match(sample) for sample in samples):
+                    # Try to convert to datetime to verify it's a date column
+                    try:
+                        pd.to_datetime(samples, errors='raise', format='mixed')
+                        filters_available["date_columns"].append(col)
+                        continue
+                    except (ValueError, TypeError, OverflowError):
+                        pass
+        
+        # Check for categorical columns with reasonable number of unique values
+        if dtype == 'object':
+            # One pass: the value_counts index is the set of non-null unique values
+            # and its length is the cardinality, so no separate nunique()/unique()
+            value_counts = df[col].value_counts(dropna=True)
+            unique_vals = len(value_counts)
+            logger.debug("Column '%s' analysis: dtype='%s', unique_vals=%d", col, dtype, unique_vals)
             
             if 2 <= unique_vals <= max_analysis_limit:
-                # Filter out None values before sorting to avoid comparison errors
-                unique_values = [val for val in df[col].unique().tolist() if val is not None]
-                filters_available["categorical_columns"][col] = sorted(unique_values)
-                print(f"DEBUG: Added '{col}' as filterable with {len(unique_values)} unique values (max analysis limit: {max_analysis_limit})")
+                filters_available["categorical_columns"][col] = sorted(value_counts.index.tolist())
+                logger.debug("Added '%s' as filterable with %d unique values (max analysis limit: %d)", col, unique_vals, max_analysis_limit)
             else:
-                print(f"DEBUG: Skipped '{col}' - unique_vals ({unique_vals}) outside range [2-{max_analysis_limit}]")
-    
-    # Check for numeric columns that could be filtered by threshold
-    for col in df.columns:
-        if pd.api.types.is_numeric_dtype(df[col]):
+                logger.debug("Skipped '%s' - unique_vals (%d) outside range [2-%d]", col, unique_vals, max_analysis_limit)
+        
+        # Check for numeric columns that could be filtered by threshold
+        elif pd.api.types.is_numeric_dtype(dtype):
             filters_available["numeric_columns"].append(col)
     
     # Set metadata flags based on what data we actually found, not hardcoded column names
@@ -83,6 +119,186 @@ def analyze_dataframe_for_filters(df):
     return filters_available
 
 
+class _FrameRef:
+    """Hashable handle that identifies a DataFrame by object identity.
+
+    Holding the reference also keeps the DataFrame alive while it is cached,
+    so its id() cannot be reused by a different DataFrame.
+    """
+    __slots__ = ("df",)
+
+    def __init__(self, df):
+        self.df = df
+
+    def __hash__(self):
+        return id(self.df)
+
+    def __eq__(self, other):
+        return isinstance(other, _FrameRef) and other.df is self.df
+
+
+# analyze_dataframe_for_filters results by id(df): (weakref to df, schema, result).
+# The weakref drops the entry when the DataFrame is freed, so the cache never keeps
+# a result frame alive on its own and a recycled id() can't return a stale entry.
+_FILTERS_AVAILABLE = {}
+_FILTERS_AVAILABLE_LOCK = threading.Lock()
+
+
+def _forget_filters_available(frame_id):
+    with _FILTERS_AVAILABLE_LOCK:
+        _FILTERS_AVAILABLE.pop(frame_id, None)
+
+
+# Converted columns (e.g. object -> datetime) keyed by DataFrame identity, column and
+# conversion kind, so repeated filter applications on the same result reuse them
+_CONVERTED_COLUMNS = OrderedDict()
+_CONVERTED_COLUMNS_MAX = 32
+_CONVERTED_COLUMNS_LOCK = threading.Lock()
+
+
+def _cached_column(df, col, kind, convert):
+    """Return convert(df[col]), memoized per DataFrame/column/kind with LRU eviction"""
+    key = (_FrameRef(df), col, kind)
+    with _CONVERTED_COLUMNS_LOCK:
+        converted = _CONVERTED_COLUMNS.get(key)
+        if converted is not None:
+            _CONVERTED_COLUMNS.move_to_end(key)
+            return converted
+    
+    converted = convert(df[col])
+    with _CONVERTED_COLUMNS_LOCK:
+        _CONVERTED_COLUMNS[key] = converted
+        while len(_CONVERTED_COLUMNS) > _CONVERTED_COLUMNS_MAX:
+            _CONVERTED_COLUMNS.popitem(last=False)
+    return converted
+
+
+def _to_datetime_coerce(series):
+    return pd.to_datetime(series, errors='coerce')
+
+
+def _to_category(series):
+    return series.astype('category')
+
+
+def get_filters_available(df):
+    """
+    Return analyze_dataframe_for_filters(df), reusing the previous result while the
+    same DataFrame object (with the same columns and dtypes) is still alive. Apply
+    re-caches the unfiltered frame under the new message, so Filter -> Apply -> Filter
+    hits as well as reopening the modal on one message.
+    The returned dict is shared between calls and must not be modified.
+    """
+    frame_id = id(df)
+    schema = (tuple(df.columns), tuple(map(str, df.dtypes)))
+    with _FILTERS_AVAILABLE_LOCK:
+        cached = _FILTERS_AVAILABLE.get(frame_id)
+    if cached is not None:
+        frame_ref, cached_schema, result = cached
+        if frame_ref() is df and cached_schema == schema:
+            return result
+
+    result = analyze_dataframe_for_filters(df)
+    frame_ref = weakref.ref(df, lambda _ref, frame_id=frame_id: _forget_filters_available(frame_id))
+    with _FILTERS_AVAILABLE_LOCK:
+        _FILTERS_AVAILABLE[frame_id] = (frame_ref, schema, result)
+    return result
+
+
+def _modal_footer_blocks():
+    """Top-N input, Clear All Filters button and tip shown at the bottom of every filter modal"""
+    return [
+        # Top N filter for limiting results
+        {
+            "type": "input",
+            "block_id": "top_n_block",
+            "label": {"type": "plain_text", "text": "Limit Results (Top N)"},
+            "element": {
+                "type": "plain_text_input",
+                "action_id": "top_n",
+                "placeholder": {"type": "plain_text", "text": "e.g., 50"}
+            },
+            "optional": True
+        },
+        # Add Clear All Filters button
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn", 
+                "text": " "
+            }
+        },
+        {
+            "type": "actions",
+            "elements": [
+                {
+                    "type": "button",
+                    "text": {
+                        "type": "plain_text",
+                        "text": "Clear All Filters"
+                    },
+                    "style": "danger",
+                    "action_id": "clear_all_filters_button"
+                }
+            ]
+        },
+        # Add instruction text for clearing filters
+        {
+            "type": "context",
+            "elements": [
+                {
+                    "type": "mrkdwn",
+                    "text": "💡 *Tip:* Leave all fields empty and click 'Apply Filters' to clear all filters and return to original results."
+                }
+            ]
+        }
+    ]
+
+
+def _wrap_filter_modal(blocks, message_ts, channel_id):
+    """Wrap modal blocks in the filter modal view payload"""
+    return {
+        "type": "modal",
+        "callback_id": FILTER_MODAL_CALLBACK_ID,
+        "title": {"type": "plain_text", "text": "Filter Query Results"},
+        "submit": {"type": "plain_text", "text": "Apply Filters"},
+        "close": {"type": "plain_text", "text": "Cancel"},
+        "private_metadata": _build_filter_modal_metadata(blocks, message_ts, channel_id),
+        "blocks": blocks
+    }
+
+
+def _build_filter_modal_metadata(blocks, message_ts, channel_id):
+    """
+    Encode "message_ts|channel_id|{action_id: state field}" for the modal.
+    The action map lets the submission read each input without inspecting its
+    action_id; it is left out if it would push the metadata past Slack's limit.
+    """
+    if not channel_id:
+        return message_ts
+    
+    metadata = f"{message_ts}|{channel_id}"
+    action_fields = {}
+    for block in blocks:
+        element = block.get("element")
+        if element and element.get("type") in _ELEMENT_STATE_FIELDS:
+            action_fields[element["action_id"]] = _ELEMENT_STATE_FIELDS[element["type"]]
+    
+    with_fields = f"{metadata}|{json.dumps(action_fields, separators=(',', ':'))}"
+    return with_fields if len(with_fields) <= _PRIVATE_METADATA_MAX_CHARS else metadata
+
+
+def parse_filter_modal_metadata(private_metadata):
+    """
+    Split filter modal private_metadata into (message_ts, channel_id, action_fields).
+    channel_id and action_fields are None when not present.
+    """
+    message_ts, _, rest = private_metadata.partition("|")
+    channel_id, _, fields_json = rest.partition("|")
+    action_fields = json.loads(fields_json) if fields_json else None
+    return message_ts, channel_id or None, action_fields
+
+
 def create_filter_modal(df, message_ts, channel_id=None, current_filters=None):
     """
     Create a dynamic filter modal based on the DataFrame structure
@@ -93,7 +309,19 @@ def create_filter_modal(df, message_ts, channel_id=None, current_filters=None):
         channel_id: Slack channel ID
         current_filters: Dict of current filter values to pre-populate the modal
     """
-    filters_available = analyze_dataframe_for_filters(df)
+    # Nothing to filter or sort on an empty/single-row result: skip column analysis
+    # and offer only the Top-N and Clear controls
+    if len(df) <= 1 or len(df.columns) == 0:
+        blocks = [
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": "*Filter your query results:*"}
+            }
+        ]
+        blocks.extend(_modal_footer_blocks())
+        return _wrap_filter_modal(blocks, message_ts, channel_id)
+    
+    filters_available = get_filters_available(df)
     
     # Initialize current_filters if not provided
     if current_filters is None:
@@ -145,10 +373,8 @@ def create_filter_modal(df, message_ts, channel_id=None, current_filters=None):
         if col in categorical_columns:
             sorted_categorical.append((col, categorical_columns[col]))
     
-    print(f"DEBUG: Processing {len(sorted_categorical)} categorical columns in DataFrame order: {[col for col, _ in sorted_categorical]}")
+    logger.debug("Processing %d categorical columns in DataFrame order", len(sorted_categorical))
     for col_name, options in sorted_categorical:
-        print(f"DEBUG: Column '{col_name}' has {len(options)} unique values: {options[:5]}{'...' if len(options) > 5 else ''}")
-        
         # Smart filtering logic based on data characteristics rather than hardcoded column names
         max_options = 50  # Default limit
         
@@ -163,7 +389,7 @@ def create_filter_modal(df, message_ts, channel_id=None, current_filters=None):
             max_options = 50   # Very large lists - stick to default
         
         if len(options) <= max_options:
-            print(f"DEBUG: Including '{col_name}' in filter modal with {len(options)} options (max allowed: {max_options})")
+            logger.debug("Including '%s' in filter modal with %d options (max allowed: %d)", col_name, len(options), max_options)
             slack_options = [
                 {"text": {"type": "plain_text", "text": str(opt)}, "value": str(opt)} 
                 for opt in options
@@ -207,16 +433,15 @@ def create_filter_modal(df, message_ts, channel_id=None, current_filters=None):
                 "optional": True
             }
             blocks.insert(1, block)  # Insert at position 1 (after header)
-            print(f"DEBUG: ✅ Added '{col_name}' filter block directly to modal at position 1")
         else:
-            print(f"DEBUG: Excluding '{col_name}' from filter modal - too many options ({len(options)} > {max_options})")
+            logger.debug("Excluding '%s' from filter modal - too many options (%d > %d)", col_name, len(options), max_options)
             continue  # Skip this column if it has too many options
     
     # Categorical blocks are now added directly above
     
     # Numeric threshold filters (for any numeric columns)
     numeric_columns = filters_available["numeric_columns"]
-    print(f"DEBUG: Found {len(numeric_columns)} numeric columns for filtering: {numeric_columns}")
+    logger.debug("Found %d numeric columns for filtering: %s", len(numeric_columns), numeric_columns)
     
     for numeric_col in numeric_columns[:2]:  # Limit to first 2 numeric columns
         # Add minimum threshold
@@ -261,13 +486,15 @@ def create_filter_modal(df, message_ts, channel_id=None, current_filters=None):
     
     # Order By filter for sorting results
     # Create options for all columns plus ascending/descending
-    order_by_options = []
-    for col in df.columns:
-        col_display = col.replace('_', ' ').title()
-        order_by_options.extend([
+    display_names = [(col, col.replace('_', ' ').title()) for col in df.columns]
+    order_by_options = [
+        option
+        for col, col_display in display_names
+        for option in (
             {"text": {"type": "plain_text", "text": f"{col_display} ↑"}, "value": f"{col}_asc"},
             {"text": {"type": "plain_text", "text": f"{col_display} ↓"}, "value": f"{col}_desc"}
-        ])
+        )
+    ]
     
     if order_by_options:
         blocks.append({
@@ -283,78 +510,68 @@ def create_filter_modal(df, message_ts, channel_id=None, current_filters=None):
             "optional": True
         })
     
-    # Top N filter for limiting results
-    blocks.append({
-        "type": "input",
-        "block_id": "top_n_block",
-        "label": {"type": "plain_text", "text": "Limit Results (Top N)"},
-        "element": {
-            "type": "plain_text_input",
-            "action_id": "top_n",
-            "placeholder": {"type": "plain_text", "text": "e.g., 50"}
-        },
-        "optional": True
-    })
-    
-    # Add Clear All Filters button
-    blocks.append({
-        "type": "section",
-        "text": {
-            "type": "mrkdwn", 
-            "text": " "
-        }
-    })
-    
-    blocks.append({
-        "type": "actions",
-        "elements": [
-            {
-                "type": "button",
-                "text": {
-                    "type": "plain_text",
-                    "text": "Clear All Filters"
-                },
-                "style": "danger",
-                "action_id": "clear_all_filters_button"
-            }
-        ]
-    })
-    
-    # Add instruction text for clearing filters
-    blocks.append({
-        "type": "context",
-        "elements": [
-            {
-                "type": "mrkdwn",
-                "text": "💡 *Tip:* Leave all fields empty and click 'Apply Filters' to clear all filters and return to original results."
-            }
-        ]
-    })
+    blocks.extend(_modal_footer_blocks())
     
-    modal = {
-        "type": "modal",
-        "callback_id": FILTER_MODAL_CALLBACK_ID,
-        "title": {"type": "plain_text", "text": "Filter Query Results"},
-        "submit": {"type": "plain_text", "text": "Apply Filters"},
-        "close": {"type": "plain_text", "text": "Cancel"},
-        "private_metadata": f"{message_ts}|{channel_id}" if channel_id else message_ts,  # Store both message_ts and channel_id
-        "blocks": blocks
-    }
+    modal = _wrap_filter_modal(blocks, message_ts, channel_id)
     
-    print(f"DEBUG: Modal created with {len(blocks)} blocks")
-    for i, block in enumerate(blocks):
-        print(f"DEBUG: Block {i}: {block.get('type', 'unknown')}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Modal created with %d blocks: %s", len(blocks),
+                     dict(Counter(block['type'] for block in blocks)))
     
     return modal
 
 
+# Row count from which threshold predicates are fused into one numexpr pass
+_NUMEXPR_MIN_ROWS = 100_000
+
+
+def _threshold_mask(df, threshold_bounds):
+    """
+    Boolean mask for [(column, {'min': x, 'max': y}), ...] min/max bounds.
+    Large frames evaluate all bounds as one numexpr expression; smaller frames
+    (or when numexpr is unavailable) compare each column's raw float array.
+    NaN/NA values never match a bound.
+    """
+    if len(df) >= _NUMEXPR_MIN_ROWS:
+        terms = []
+        bound_values = {}
+        for i, (col, thresholds) in enumerate(threshold_bounds):
+            for bound, op in (('min', '>='), ('max', '<=')):
+                if bound in thresholds:
+                    name = f"{bound}_{i}"
+                    bound_values[name] = thresholds[bound]
+                    terms.append(f"(`{col}` {op} @{name})")
+        try:
+            result = df.eval(" & ".join(terms), engine='numexpr', local_dict=bound_values)
+            return result.to_numpy(dtype=bool)
+        except (ImportError, SyntaxError, TypeError, ValueError):
+            pass  # Fall back to the per-column NumPy comparisons below
+    
+    mask = np.ones(len(df), dtype=bool)
+    for col, thresholds in threshold_bounds:
+        # Compare on the raw float array (no copy for float64 columns)
+        col_vals = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+        if 'min' in thresholds:
+            mask &= col_vals >= thresholds['min']
+        if 'max' in thresholds:
+            mask &= col_vals <= thresholds['max']
+    return mask
+
+
 def apply_pandas_filters(df, filter_values):
     """
     Apply filters to DataFrame using pandas operations
     Returns filtered DataFrame and a description of applied filters
+    
+    All row predicates are combined into one boolean mask over df and applied
+    once, instead of re-slicing the DataFrame after every filter.
     """
-    filtered_df = df.copy()
+    mask = np.ones(len(df), dtype=bool)
     applied_filters = []
+    # Case-insensitive column lookup, built once per call (first column wins on clashes)
+    upper_to_col = {}
+    for col in df.columns:
+        upper_to_col.setdefault(col.upper(), col)
     
     # Apply date range filters
     date_columns = [col for col in df.columns if 'DATE' in col.upper() or 'PERIOD' in col.upper()]
@@ -365,18 +582,26 @@ def apply_pandas_filters(df, filter_values):
         end_date = filter_values.get('end_date')
         
         if start_date or end_date:
-            # Convert date column to datetime if it's not already
-            if filtered_df[date_col].dtype == 'object':
-                filtered_df[date_col] = pd.to_datetime(filtered_df[date_col])
+            # Convert date column to datetime if it's not already; the parsed column is
+            # cached so re-applying filters to the same result skips the string parse
+            date_values = df[date_col]
+            if date_values.dtype == 'object':
+                date_values = _cached_column(df, date_col, 'datetime', _to_datetime_coerce)
+            
+            # Tz-naive datetime64 columns compare as a raw NumPy array (NaT never matches);
+            # anything else (tz-aware, Python date objects) keeps the pandas comparison
+            if isinstance(date_values.dtype, np.dtype) and date_values.dtype.kind == 'M':
+                date_values = date_values.to_numpy()
+                to_bound = np.datetime64
+            else:
+                to_bound = pd.to_datetime
             
             if start_date:
-                start_datetime = pd.to_datetime(start_date)
-                filtered_df = filtered_df[filtered_df[date_col] >= start_datetime]
+                mask &= np.asarray(date_values >= to_bound(start_date))
                 applied_filters.append(f"{date_col} >= {start_date}")
             
             if end_date:
-                end_datetime = pd.to_datetime(end_date)
-                filtered_df = filtered_df[filtered_df[date_col] <= end_datetime]
+                mask &= np.asarray(date_values <= to_bound(end_date))
                 applied_filters.append(f"{date_col} <= {end_date}")
     
     # Apply categorical filters
@@ -386,12 +611,15 @@ def apply_pandas_filters(df, filter_values):
             col_name = key.replace('_select', '').upper()
             
             # Find matching column (case-insensitive)
-            matching_cols = [col for col in df.columns if col.upper() == col_name]
-            if matching_cols:
-                col = matching_cols[0]
-                selected_values = [opt['value'] for opt in values]
-                filtered_df = filtered_df[filtered_df[col].isin(selected_values)]
-                applied_filters.append(f"{col} in {selected_values}")
+            col = upper_to_col.get(col_name)
+            if col is not None:
+                selected_values = {opt['value'] for opt in values}
+                col_values = df[col]
+                if col_values.dtype == 'object':
+                    # Category codes make isin an integer compare; converted once per result
+                    col_values = _cached_column(df, col, 'category', _to_category)
+                mask &= col_values.isin(selected_values).to_numpy()
+                applied_filters.append(f"{col} in {sorted(selected_values)}")
     
     # Apply numeric threshold filters (min/max ranges)
     # Group min/max thresholds by column
@@ -421,23 +649,28 @@ def apply_pandas_filters(df, filter_values):
                 pass  # Skip invalid numeric values
     
     # Apply the threshold filters
+    threshold_bounds = []
     for col_name, thresholds in threshold_filters.items():
         # Find matching column (case-insensitive)
-        matching_cols = [col for col in df.columns if col.upper() == col_name]
-        if matching_cols:
-            col = matching_cols[0]
+        col = upper_to_col.get(col_name)
+        if col is not None:
+            threshold_bounds.append((col, thresholds))
             
             # Apply minimum threshold
             if 'min' in thresholds:
-                min_threshold = thresholds['min']
-                filtered_df = filtered_df[filtered_df[col] >= min_threshold]
-                applied_filters.append(f"{col} >= {min_threshold:,.0f}")
+                applied_filters.append(f"{col} >= {thresholds['min']:,.0f}")
             
             # Apply maximum threshold
             if 'max' in thresholds:
-                max_threshold = thresholds['max']
-                filtered_df = filtered_df[filtered_df[col] <= max_threshold]
-                applied_filters.append(f"{col} <= {max_threshold:,.0f}")
+                applied_filters.append(f"{col} <= {thresholds['max']:,.0f}")
+    
+    if threshold_bounds:
+        mask &= _threshold_mask(df, threshold_bounds)
+    
+    # Apply the combined row filter once; sorting and limiting operate on the result.
+    # With no row predicates the original frame is passed through untouched - the
+    # sort/head steps below return new frames, so df itself is never modified.
+    filtered_df = df[mask] if applied_filters else df
     
     # Apply order by sorting
     order_by = filter_values.get('order_by_select')
@@ -470,31 +703,53 @@ def apply_pandas_filters(df, filter_values):
     return filtered_df, applied_filters
 
 
-def extract_filter_values_from_modal(view_state):
+# Slack view-state field holding the value of each input element type
+_ELEMENT_STATE_FIELDS = {
+    "datepicker": "selected_date",
+    "static_select": "selected_option",
+    "multi_static_select": "selected_options",
+    "plain_text_input": "value",
+}
+_PRIVATE_METADATA_MAX_CHARS = 3000
+
+# Modal action_id -> (Slack state field, factory for the missing-value default).
+# Fixed inputs are matched exactly; per-column inputs by their last "_" segment
+# ("<col>_select", "<col>_min_threshold", "<col>_max_threshold", legacy "<col>_threshold").
+_FIXED_ACTION_FIELDS = {
+    'start_date': ('selected_date', None),
+    'end_date': ('selected_date', None),
+    'order_by_select': ('selected_option', None),  # single select for order by
+    'top_n': ('value', None),
+}
+_SUFFIX_ACTION_FIELDS = {
+    'select': ('selected_options', list),  # multi select for other filters
+    'threshold': ('value', None),
+}
+
+
+def extract_filter_values_from_modal(view_state, action_fields=None):
     """
     Extract filter values from the modal submission
+    
+    action_fields is the {action_id: state field} map recorded in the modal's
+    private_metadata (see parse_filter_modal_metadata); without it each input's
+    field is inferred from its action_id.
     """
     filter_values = {}
     
     for block_id, block_data in view_state.items():
         for action_id, action_data in block_data.items():
-            if action_id == 'start_date':
-                filter_values['start_date'] = action_data.get('selected_date')
-            elif action_id == 'end_date':
-                filter_values['end_date'] = action_data.get('selected_date')
-            elif action_id.endswith('_select'):
-                if action_id == 'order_by_select':
-                    # Single select for order by
-                    filter_values[action_id] = action_data.get('selected_option')
-                else:
-                    # Multi select for other filters
-                    filter_values[action_id] = action_data.get('selected_options', [])
-            elif action_id.endswith('_min_threshold') or action_id.endswith('_max_threshold'):
-                filter_values[action_id] = action_data.get('value')
-            elif action_id.endswith('_threshold'):  # Keep for backward compatibility
-                filter_values[action_id] = action_data.get('value')
-            elif action_id == 'top_n':
-                filter_values['top_n'] = action_data.get('value')
+            if action_fields is not None:
+                state_key = action_fields.get(action_id)
+                if state_key is None:
+                    continue
+                default = list if state_key == 'selected_options' else None
+            else:
+                field = _FIXED_ACTION_FIELDS.get(action_id) or _SUFFIX_ACTION_FIELDS.get(action_id.rpartition('_')[2])
+                if field is None:
+                    continue
+                state_key, default = field
+            filter_values[action_id] = action_data.get(state_key, default() if default else None)
     
     return filter_values
 
@@ -507,10 +762,8 @@ def _convert_filter_to_friendly_format(filter_desc):
     - "TOTAL_SALES >= 1000000" -> "Total Sales: >= $1,000,000"
     - "START_DATE >= 2024-01-01" -> "Start Date: >= 2024-01-01"
     """
-    import re
-    
     # Handle "in" filters (categorical)
-    in_match = re.match(r"(\w+) in \[(.+)\]", filter_desc)
+    in_match = _IN_FILTER_RE.match(filter_desc)
     if in_match:
         column = in_match.group(1).replace('_', ' ').title()
         values_str = in_match.group(2)
@@ -519,7 +772,7 @@ def _convert_filter_to_friendly_format(filter_desc):
         return f"{column}: {', '.join(values)}"
     
     # Handle comparison filters (>=, <=, >, <, =)
-    comp_match = re.match(r"(\w+) ([><=]+) (.+)", filter_desc)
+    comp_match = _COMPARISON_FILTER_RE.match(filter_desc)
     if comp_match:
         column = comp_match.group(1).replace('_', ' ').title()
         operator = comp_match.group(2)
@@ -544,11 +797,12 @@ def _convert_filter_to_friendly_format(filter_desc):
     return filter_desc.replace('_', ' ').title()
 
 
-def create_filtered_result_message(filtered_df, applied_filters, original_count):
+def create_filtered_result_message(filtered_df, applied_filters, original_count, capped=False):
     """
-    Create the message blocks for displaying filtered results
+    Create the message blocks for displaying filtered results.
+    capped marks data that is only the first rows of a larger query result.
     """
-    from app import _get_safe_table_text, get_action_buttons_block
+    from app import _get_safe_table_text, get_action_buttons_block, CAPPED_RESULT_NOTE
     
     blocks = []
     
@@ -564,6 +818,8 @@ def create_filtered_result_message(filtered_df, applied_filters, original_count)
         filter_summary += f"\n\nResults: {len(filtered_df):,} of {original_count:,} rows"
     else:
         filter_summary = "📊 All Data - no filters applied"
+    if capped:
+        filter_summary += CAPPED_RESULT_NOTE
     
     blocks.append({
         "type": "section",
@@ -619,21 +875,28 @@ def create_filtered_result_message(filtered_df, applied_filters, original_count)
     return blocks
 
 
-def get_sample_data_for_filters(df, max_samples=5):
+def get_sample_data_for_filters(df, max_samples=5, sample_window=10000):
     """
     Get sample data to show users what values are available for filtering
+    
+    Values and stats are taken from the first sample_window rows only, so on larger
+    results the categorical detection and min/max/mean are approximate.
     """
     samples = {}
-    
-    for col in df.columns:
-        if df[col].dtype == 'object' and df[col].nunique() <= 20:
-            unique_vals = df[col].unique()
+    sample = df.head(sample_window)
+    # min/max/mean for all numeric columns in one fused reduction
+    numeric_df = sample.select_dtypes(include=['number', 'bool'])
+    numeric_stats = numeric_df.agg(['min', 'max', 'mean'])
+    
+    for col in sample.columns:
+        if sample[col].dtype == 'object' and sample[col].nunique() <= 20:
+            unique_vals = sample[col].unique()
             samples[col] = unique_vals[:max_samples].tolist()
-        elif pd.api.types.is_numeric_dtype(df[col]):
+        elif col in numeric_stats.columns:
             samples[col] = {
-                'min': float(df[col].min()),
-                'max': float(df[col].max()),
-                'mean': float(df[col].mean())
+                'min': float(numeric_stats.at['min', col]),
+                'max': float(numeric_stats.at['max', col]),
+                'mean': float(numeric_stats.at['mean', col])
             }
     
     return samples
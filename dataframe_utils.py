@@ -0,0 +1,62 @@
+"""
+DataFrame helpers shared by the Slack Sales Bot handlers.
+
+Query results are prepared once, right after they are fetched, and the prepared
+frame is cached; display, filtering, charting and download all reuse it.
+"""
+
+import logging
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def coerce_for_plot(df):
+    """
+    Robust type conversion for plotting, applied once to a freshly fetched result:
+    - first column parsed as datetime when it is text and any value parses
+    - text columns that are mostly (>50%) numeric converted to numbers
+    - numeric columns cast to int when every value is whole, float otherwise
+    - rows with missing values in any numeric column dropped
+    Modifies and returns df.
+    """
+    if len(df.columns) >= 2:
+        # Snapshot labels and dtypes once; type checks read the snapshot and only
+        # columns that actually get converted are fetched from df
+        columns = df.columns.tolist()
+        dtypes = df.dtypes.to_dict()
+        first_col = columns[0]
+        if pd.api.types.is_object_dtype(dtypes[first_col]) or pd.api.types.is_string_dtype(dtypes[first_col]):
+            try:
+                temp_col = pd.to_datetime(df[first_col], errors='coerce')
+                if not temp_col.isna().all():
+                    df[first_col] = temp_col
+                    dtypes[first_col] = temp_col.dtype
+                    logger.debug("Converted column '%s' to datetime where possible.", first_col)
+            except Exception as e:
+                logger.debug("Could not convert column '%s' to datetime: %s", first_col, e)
+
+        for col in columns:
+            try:
+                dtype = dtypes[col]
+                if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+                    temp_col = pd.to_numeric(df[col], errors='coerce')
+                    if temp_col.notna().mean() > 0.5:
+                        df[col] = temp_col
+                        logger.debug("Converted column '%s' to numeric where possible.", col)
+                elif pd.api.types.is_numeric_dtype(dtype):
+                    # Whole-number check on the non-null values in one vectorized pass;
+                    # ints can't hold NaN, so such columns keep their dtype
+                    values = df[col]
+                    non_null = values.dropna()
+                    if not (non_null % 1 == 0).all():
+                        df[col] = values.astype(float)
+                    elif len(non_null) == len(values):
+                        df[col] = values.astype(int)
+            except Exception as e:
+                logger.debug("Could not convert column '%s' to numeric: %s", col, e)
+
+    numeric_cols = [col for col, dtype in df.dtypes.items() if pd.api.types.is_numeric_dtype(dtype)]
+    if numeric_cols:
+        df.dropna(subset=numeric_cols, inplace=True)
+    return df
@@ -12,7 +12,9 @@ import base64
 from getpass import getpass
 import hashlib
 import logging
+import os
 import sys
+import threading
 
 # This class relies on the PyJWT module (https://pypi.org/project/PyJWT/).
 import jwt
@@ -36,6 +38,35 @@ SUBJECT = "sub"
 def get_private_key_passphrase():
     return getpass('Passphrase for private key: ')
 
+# Loaded keys by file path, as (mtime, key). A changed mtime means the key was rotated.
+_private_key_cache = {}
+_private_key_lock = threading.Lock()
+
+def load_private_key(private_key_file_path: Text):
+    """
+    Loads the private key from a PEM file, reusing the parsed key until the file changes.
+    Parsing validates the RSA key, which is the expensive part of every reconnect.
+    :param private_key_file_path: Path to the private key file.
+    :return: the private key object
+    """
+    mtime = os.path.getmtime(private_key_file_path)
+    with _private_key_lock:
+        cached = _private_key_cache.get(private_key_file_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with open(private_key_file_path, 'rb') as pem_in:
+            pemlines = pem_in.read()
+        try:
+            # Try to access the private key without a passphrase.
+            private_key = load_pem_private_key(pemlines, None, default_backend())
+        except TypeError:
+            # If that fails, provide the passphrase returned from get_private_key_passphrase().
+            private_key = load_pem_private_key(pemlines, get_private_key_passphrase().encode(), default_backend())
+
+        _private_key_cache[private_key_file_path] = (mtime, private_key)
+        return private_key
+
 class JWTGenerator(object):
     """
     Creates and signs a JWT with the specified private key file, username, and account identifier. The JWTGenerator keeps the
@@ -73,14 +104,9 @@ class JWTGenerator(object):
         self.token = None
 
         # Load the private key from the specified file.
-        with open(self.private_key_file_path, 'rb') as pem_in:
-            pemlines = pem_in.read()
-            try:
-                # Try to access the private key without a passphrase.
-                self.private_key = load_pem_private_key(pemlines, None, default_backend())
-            except TypeError:
-                # If that fails, provide the passphrase returned from get_private_key_passphrase().
-                self.private_key = load_pem_private_key(pemlines, get_private_key_passphrase().encode(), default_backend())
+        self.private_key = load_private_key(self.private_key_file_path)
+        # The issuer only depends on the key, so compute its fingerprint once.
+        self.public_key_fp = self.calculate_public_key_fingerprint(self.private_key)
 
     def prepare_account_name_for_jwt(self, raw_account: Text) -> Text:
         """
@@ -119,8 +145,7 @@ class JWTGenerator(object):
             self.renew_time = now + self.renewal_delay
 
             # Prepare the fields for the payload.
-            # Generate the public key fingerprint for the issuer in the payload.
-            public_key_fp = self.calculate_public_key_fingerprint(self.private_key)
+            public_key_fp = self.public_key_fp
 
             # Create our payload
             payload = {
@@ -148,6 +173,12 @@ class JWTGenerator(object):
 
         return self.token
 
+    def expire_token(self):
+        """
+        Forces the next call to get_token() to sign a new JWT, e.g. after the server rejected the current one.
+        """
+        self.renew_time = datetime.now(timezone.utc)
+
     def calculate_public_key_fingerprint(self, private_key: Text) -> Text:
         """
         Given a private key in PEM format, return the public key fingerprint.